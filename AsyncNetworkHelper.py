@@ -0,0 +1,223 @@
+"""
+
+
+This module offers asyncio counterparts of the NetWorkHelper methods. The waiting between two counter snapshots is
+done with asyncio.sleep, so any number of measurements can run at the same time on a single event loop thread. The
+snapshots themselves are short reads of /proc and netlink, they are handed to the default executor so a large socket
+table never stalls the loop. Measurements that need a snapshot at about the same time share one read, so N concurrent
+measurements cost one read per tick instead of N.
+
+"""
+
+import asyncio
+import time
+
+from NetworkHelper import NetWorkHelper
+
+
+class AsyncNetWorkHelper:
+    """
+
+    The AsyncNetWorkHelper class wraps a NetWorkHelper and exposes its collection methods as coroutines.
+
+    """
+
+    def __init__(self, helper=None, coalesce=0.01):
+        """
+
+        :param helper: (NetWorkHelper) The helper to wrap, a new one by default.
+        :param coalesce: (float) The seconds a counter read waits for more callers to join it.
+
+        """
+        self.helper = helper if helper is not None else NetWorkHelper()
+        self.coalesce = coalesce
+        # The pids and the future of the counter read that new callers join, None when no read is waiting.
+        self.pendingRead = None
+        # The running reads, kept so their tasks are not garbage collected.
+        self.readTasks = set()
+        self.reads = 0
+
+    async def runBlocking(self, function, *args):
+        """
+
+        This method runs a short blocking read in the default executor.
+
+        :param function: (callable) The function to run.
+
+        :return : The result of the function.
+
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def readCounters(self, pids):
+        """
+
+        This method reads the counters of some pids through a read that is shared with every other caller that asks
+        within the coalesce window, for the union of all their pids.
+
+        :param pids: (list) The process ids, as integers.
+
+        :return : (dict) The pids as keys and (bytes_sent, bytes_received) tuples as values, (float) the time the
+        counters were read.
+
+        """
+        loop = asyncio.get_running_loop()
+        if self.pendingRead is None:
+            self.pendingRead = (set(), loop.create_future())
+            loop.call_later(self.coalesce, self.startRead)
+        wanted, future = self.pendingRead
+        wanted.update(pids)
+        # A caller that is cancelled must not cancel the read the other callers wait on.
+        counters, timestamp = await asyncio.shield(future)
+        return {pid: counters[pid] for pid in pids if pid in counters}, timestamp
+
+    def startRead(self):
+        """
+
+        This method closes the pending read to new callers and starts it. Callers that come after it join the next one.
+
+        """
+        wanted, future = self.pendingRead
+        self.pendingRead = None
+        task = asyncio.ensure_future(self.finishRead(wanted, future))
+        self.readTasks.add(task)
+        task.add_done_callback(self.readTasks.discard)
+
+    async def finishRead(self, wanted, future):
+        """
+
+        This method runs one shared read and hands the result, or the error, to every caller of it.
+
+        """
+        self.reads += 1
+        try:
+            counters = await self.runBlocking(self.helper.counterSource, list(wanted))
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve it here too, so a read whose callers were all cancelled does not warn.
+            future.exception()
+        else:
+            future.set_result((counters, time.time()))
+
+    async def netstat(self, native=None, filters=None):
+        """
+
+        This method gets the connections of the system as text, like NetWorkHelper.netstat.
+
+        :param native: (bool) True to read the /proc/net socket tables directly, false to run the netstat command.
+        :param filters: (ConnectionFilter) Optional filter, only the connections that match are returned.
+
+        :return : (str) The connections, one per line.
+
+        """
+        return await self.runBlocking(self.helper.netstat, native, filters)
+
+    async def getConnections(self, protocols=None, filters=None):
+        """
+
+        This method reads the connections of the system as Connection records.
+
+        :param protocols: (list) The socket tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param filters: (ConnectionFilter) Optional filter the connections have to match.
+
+        :return : (list) The Connection records.
+
+        """
+        return await self.runBlocking(lambda: list(self.helper.iterConnections(protocols, True, filters)))
+
+    async def calcBandwidthBatch(self, pids, interval, ticks=1):
+        """
+
+        This method samples the counters of many processes on one shared clock, like
+        NetWorkHelper.calcBandwidthBatch, but waits with asyncio.sleep. Concurrent calls share their counter reads.
+
+        :param pids: (list) The process ids to calculate the bandwidth for.
+        :param interval: (int) The interval or the time to elapse.
+        :param ticks: (int) The number of equal steps to split the interval in, 1 for a single elapsed sample.
+
+        :return : (dict) The pids as keys and lists of (elapsed_time, bytes_sent, bytes_received) tuples as values.
+
+        """
+        pids = list(dict.fromkeys(int(pid) for pid in pids))
+        samples = {pid: [] for pid in pids}
+        step = interval / ticks
+
+        previous, previous_time = await self.readCounters(pids)
+        for _ in range(ticks):
+            await asyncio.sleep(step)
+            current, current_time = await self.readCounters(pids)
+            self.helper.addSamples(samples, previous, current, current_time - previous_time)
+            previous, previous_time = current, current_time
+        return samples
+
+    async def getBandwidthById(self, pid, interval=10, elapsed=True, args=None, print_output=True):
+        """
+
+        This method gets the bandwidth for a single pid, like NetWorkHelper.getBandwidthById.
+
+        :param pid: (int) The process id to calculate it's bandwidth.
+        :param interval: (int) The interval or the time to elapse.
+        :param elapsed: (bool) True if you want elapsed, false if second by second.
+        :param args: (list) The unit argument, -byte/-b, -kilobyte/-k, -megabyte/-m or -gigabyte/-g.
+        :param print_output: (bool) True if you want to print the output, false if not.
+
+        :return : The same result as NetWorkHelper.getBandwidthById.
+
+        """
+        ticks = 1 if elapsed else interval
+        samples = await self.calcBandwidthBatch([pid], interval, ticks)
+        results = self.helper.formatSamples([pid], samples, ticks, interval, elapsed, args or ["-byte"], print_output)
+        return results[0] if results else None
+
+    async def getAllBandwidth(self, pids=None, interval=10, elapsed=True, args=None, print_output=True):
+        """
+
+        This method gets the bandwidth for a list of pids, all sampled together in about one interval.
+
+        :param pids: (list) The process ids, defaults to every process with a socket.
+        :param interval: (int) The interval or the time to elapse.
+        :param elapsed: (bool) True if you want elapsed, false if second by second.
+        :param args: (list) The unit argument, -byte/-b, -kilobyte/-k, -megabyte/-m or -gigabyte/-g.
+        :param print_output: (bool) True if you want to print the output, false if not.
+
+        :return : (list) The same results as NetWorkHelper.getAllBandwidth.
+
+        """
+        if pids is None or pids == []:
+            pids = await self.runBlocking(self.helper.getDefaultPids)
+        if args is None:
+            args = ["-byte"]
+        ticks = 1 if elapsed else interval
+        samples = await self.calcBandwidthBatch(pids, interval, ticks)
+        return self.helper.formatSamples(pids, samples, ticks, interval, elapsed, args, print_output)
+
+    async def iterSamples(self, pids=None, interval=1, rounds=None):
+        """
+
+        This method keeps sampling and yields the change of every process after each interval.
+
+        :param pids: (list) The process ids to follow, defaults to the processes with a socket at each tick.
+        :param interval: (float) The time between two samples in seconds.
+        :param rounds: (int) The number of samples to yield, defaults to forever.
+
+        :return : (async generator) Dicts with the pids as keys and (elapsed_time, bytes_sent, bytes_received) tuples
+        as values.
+
+        """
+        loop = asyncio.get_running_loop()
+        tickPids = pids if pids else await self.runBlocking(self.helper.getDefaultPids)
+        tickPids = [int(pid) for pid in tickPids]
+        previous, previous_time = await self.readCounters(tickPids)
+        next_tick = loop.time()
+        done = 0
+        while rounds is None or done < rounds:
+            next_tick += interval
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+            if not pids:
+                tickPids = [int(pid) for pid in await self.runBlocking(self.helper.getDefaultPids)]
+            current, current_time = await self.readCounters(tickPids)
+            samples = {pid: [] for pid in tickPids}
+            self.helper.addSamples(samples, previous, current, current_time - previous_time)
+            previous, previous_time = current, current_time
+            done += 1
+            yield {pid: sample[0] for pid, sample in samples.items() if sample}
@@ -0,0 +1,363 @@
+"""
+
+
+This module holds a snapshot of the socket tables as parallel NumPy arrays, one per column, so counting and filtering
+connections by pid, port or state runs as vectorised array operations instead of a Python loop per row. NumPy is an
+optional dependency, it is only needed when this module is used.
+
+"""
+
+import os
+import socket
+import sys
+
+from ProcNet import PROC_NET_TABLES, TCP_STATES, Connection, ProcNetReader
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The socket tables, in the order of their code in the proto column.
+PROTOCOLS = list(PROC_NET_TABLES)
+# The state column of UDP rows, which have no connection state. No TCP state has code 0.
+NO_STATE = 0
+
+
+def requireNumpy():
+    """
+
+    This function raises an ImportError with a hint when NumPy is not installed.
+
+    """
+    if np is None:
+        raise ImportError("The columnar snapshot needs NumPy, install it with: pip install numpy")
+
+
+class ColumnarSnapshot:
+    """
+
+    The ColumnarSnapshot class stores connections as parallel arrays. Addresses are kept as two 64-bit halves in
+    network order, IPv4 addresses only use the low half. An unknown pid is stored as -1.
+
+    """
+
+    def __init__(self, columns):
+        requireNumpy()
+        self.columns = columns
+        # Prebuilt indexes, column name -> (sorted unique values, start offsets, row order).
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.columns["proto"])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns")
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @classmethod
+    def capture(cls, reader=None, protocols=None, resolve_pids=True):
+        """
+
+        This method reads the socket tables straight into columns, without building a record per row.
+
+        :param reader: (ProcNetReader) The reader to use, a new one by default.
+        :param protocols: (list) The tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param resolve_pids: (bool) True if you want the pid column filled in, false if not.
+
+        :return : (ColumnarSnapshot) The snapshot.
+
+        """
+        requireNumpy()
+        if reader is None:
+            reader = ProcNetReader()
+        if protocols is None:
+            protocols = PROTOCOLS
+
+        protos, ports, states, inodes, uids = [], [], [], [], []
+        # Four 32-bit words per address, local then remote, as the kernel prints them.
+        words = []
+        for proto in protocols:
+            code = PROTOCOLS.index(proto)
+            isTcp = proto.startswith("tcp")
+            try:
+                table = open(os.path.join(reader.proc_root, "net", proto), "r", encoding="ascii",
+                             buffering=1 << 16)
+            except OSError:
+                continue
+            with table:
+                next(table, None)
+                for line in table:
+                    fields = line.split()
+                    if len(fields) < 10:
+                        continue
+                    localHex, localPort = fields[1].split(":")
+                    remoteHex, remotePort = fields[2].split(":")
+                    for address in (localHex, remoteHex):
+                        if len(address) == 8:
+                            words.extend((0, 0, 0, int(address, 16)))
+                        else:
+                            words.extend(int(address[i:i + 8], 16) for i in range(0, 32, 8))
+                    protos.append(code)
+                    ports.append((int(localPort, 16), int(remotePort, 16)))
+                    states.append(int(fields[3], 16) if isTcp else NO_STATE)
+                    uids.append(int(fields[7]))
+                    inodes.append(int(fields[9]))
+
+        count = len(protos)
+        if reader.instrumentation is not None:
+            reader.instrumentation.count("rows_parsed", count)
+        addresses = np.array(words, dtype=np.uint32).reshape(count, 8)
+        if sys.byteorder == "little":
+            # Every word was printed in host order, flip them all to network order at once. IPv4 rows only have the
+            # last word set, the zero words are not affected.
+            addresses = addresses.byteswap()
+        addresses = addresses.astype(np.uint64)
+        ports = np.array(ports, dtype=np.uint16).reshape(count, 2)
+        columns = {
+            "proto": np.array(protos, dtype=np.uint8),
+            "local_hi": (addresses[:, 0] << np.uint64(32)) | addresses[:, 1],
+            "local_lo": (addresses[:, 2] << np.uint64(32)) | addresses[:, 3],
+            "local_port": ports[:, 0],
+            "remote_hi": (addresses[:, 4] << np.uint64(32)) | addresses[:, 5],
+            "remote_lo": (addresses[:, 6] << np.uint64(32)) | addresses[:, 7],
+            "remote_port": ports[:, 1],
+            "state": np.array(states, dtype=np.uint8),
+            "inode": np.array(inodes, dtype=np.uint64),
+            "uid": np.array(uids, dtype=np.uint32),
+            "pid": np.full(count, -1, dtype=np.int32),
+        }
+        snapshot = cls(columns)
+        if resolve_pids:
+            snapshot.assignPids(reader.buildInodeIndex())
+        return snapshot
+
+    def assignPids(self, inodeIndex):
+        """
+
+        This method fills the pid column from an inode to pid index with one sorted lookup.
+
+        :param inodeIndex: (dict) The socket inodes as keys and their pids as values.
+
+        """
+        if not inodeIndex or not len(self):
+            return
+        keys = np.fromiter(inodeIndex.keys(), dtype=np.uint64, count=len(inodeIndex))
+        values = np.fromiter(inodeIndex.values(), dtype=np.int32, count=len(inodeIndex))
+        order = np.argsort(keys)
+        keys, values = keys[order], values[order]
+        positions = np.minimum(np.searchsorted(keys, self.columns["inode"]), len(keys) - 1)
+        found = keys[positions] == self.columns["inode"]
+        self.columns["pid"] = np.where(found, values[positions], -1).astype(np.int32)
+        self.indexes.pop("pid", None)
+
+    def mask(self, protocols=None, states=None, local_ports=None, remote_ports=None, pids=None):
+        """
+
+        This method builds a boolean mask of the rows that match every given criterion.
+
+        :param protocols: (list) The socket tables to keep, such as ["tcp", "tcp6"].
+        :param states: (list) The TCP states to keep, such as ["ESTABLISHED"].
+        :param local_ports: (list) The local ports to keep.
+        :param remote_ports: (list) The remote ports to keep.
+        :param pids: (list) The pids to keep.
+
+        :return : (numpy.ndarray) The mask.
+
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if protocols is not None:
+            mask &= np.isin(self.columns["proto"], [PROTOCOLS.index(proto) for proto in protocols])
+        if states is not None:
+            codes = {name: int(code, 16) for code, name in TCP_STATES.items()}
+            mask &= np.isin(self.columns["state"], [codes[state.upper()] for state in states])
+        if local_ports is not None:
+            mask &= np.isin(self.columns["local_port"], local_ports)
+        if remote_ports is not None:
+            mask &= np.isin(self.columns["remote_port"], remote_ports)
+        if pids is not None:
+            mask &= np.isin(self.columns["pid"], pids)
+        return mask
+
+    def select(self, rows):
+        """
+
+        This method returns a new snapshot with only some rows.
+
+        :param rows: (numpy.ndarray) A boolean mask or an array of row numbers.
+
+        :return : (ColumnarSnapshot) The selected rows.
+
+        """
+        return ColumnarSnapshot({name: column[rows] for name, column in self.columns.items()})
+
+    def filter(self, **criteria):
+        """
+
+        This method returns the rows that match the criteria of mask().
+
+        :return : (ColumnarSnapshot) The matching rows.
+
+        """
+        return self.select(self.mask(**criteria))
+
+    def countBy(self, column):
+        """
+
+        This method counts the connections per value of a column.
+
+        :param column: (str) The column to group by, such as pid, remote_port or state.
+
+        :return : (dict) The values as keys and the number of connections as values.
+
+        """
+        values, counts = np.unique(self.columns[column], return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+    def connectionsPerPid(self):
+        """
+
+        This method counts the connections of every process, leaving out the ones without a known pid.
+
+        :return : (dict) The pids as keys and their number of connections as values.
+
+        """
+        counts = self.countBy("pid")
+        counts.pop(-1, None)
+        return counts
+
+    def connectionsPerRemotePort(self):
+        """
+
+        This method counts the connections per remote port.
+
+        :return : (dict) The ports as keys and their number of connections as values.
+
+        """
+        return self.countBy("remote_port")
+
+    def connectionsPerState(self):
+        """
+
+        This method counts the connections per state.
+
+        :return : (dict) The state names as keys and their number of connections as values, UDP sockets are counted
+        under an empty name.
+
+        """
+        return {self.stateName(code): count for code, count in self.countBy("state").items()}
+
+    @staticmethod
+    def stateName(code):
+        """
+
+        This method turns a state code into the name the Connection records use.
+
+        :param code: (int) The state code.
+
+        :return : (str) The state name, empty for UDP rows.
+
+        """
+        if code == NO_STATE:
+            return ""
+        return TCP_STATES.get(f"{code:02X}", str(code))
+
+    def buildIndex(self, column):
+        """
+
+        This method builds an index of a column, so the rows of one value can be found without scanning.
+
+        :param column: (str) The column to index, such as pid or local_port.
+
+        :return : (tuple) The sorted unique values, the start of each value in the row order, and the row order.
+
+        """
+        index = self.indexes.get(column)
+        if index is None:
+            order = np.argsort(self.columns[column], kind="stable")
+            values, starts = np.unique(self.columns[column][order], return_index=True)
+            index = self.indexes[column] = (values, starts, order)
+        return index
+
+    def rowsFor(self, column, value):
+        """
+
+        This method finds the rows where a column has a value, through the index of the column.
+
+        :param column: (str) The indexed column, such as pid, local_port or remote_port.
+        :param value: The value to look for.
+
+        :return : (numpy.ndarray) The row numbers.
+
+        """
+        values, starts, order = self.buildIndex(column)
+        position = np.searchsorted(values, value)
+        if position >= len(values) or values[position] != value:
+            return np.empty(0, dtype=order.dtype)
+        end = starts[position + 1] if position + 1 < len(starts) else len(order)
+        return order[starts[position]:end]
+
+    def rowsForPid(self, pid):
+        """
+
+        This method finds the rows of a process.
+
+        :param pid: (int) The process id.
+
+        :return : (numpy.ndarray) The row numbers.
+
+        """
+        return self.rowsFor("pid", pid)
+
+    def rowsForPort(self, port, remote=False):
+        """
+
+        This method finds the rows with a local or remote port.
+
+        :param port: (int) The port.
+        :param remote: (bool) True to look at the remote port, false for the local port.
+
+        :return : (numpy.ndarray) The row numbers.
+
+        """
+        return self.rowsFor("remote_port" if remote else "local_port", port)
+
+    def toConnections(self, rows=None):
+        """
+
+        This method turns rows back into Connection records.
+
+        :param rows: (numpy.ndarray) Optional mask or row numbers, defaults to every row.
+
+        :return : (list) The Connection records.
+
+        """
+        columns = self.columns if rows is None else {name: column[rows] for name, column in self.columns.items()}
+        connections = []
+        for row in range(len(columns["proto"])):
+            proto = PROTOCOLS[columns["proto"][row]]
+            family = PROC_NET_TABLES[proto]
+            local = self.formatAddress(columns["local_hi"][row], columns["local_lo"][row], family)
+            remote = self.formatAddress(columns["remote_hi"][row], columns["remote_lo"][row], family)
+            pid = int(columns["pid"][row])
+            connections.append(Connection(proto.upper(), local, int(columns["local_port"][row]), remote,
+                                          int(columns["remote_port"][row]),
+                                          self.stateName(int(columns["state"][row])),
+                                          int(columns["inode"][row]), int(columns["uid"][row]),
+                                          pid if pid >= 0 else None))
+        return connections
+
+    @staticmethod
+    def formatAddress(high, low, family):
+        """
+
+        This method formats an address stored as two 64-bit halves.
+
+        :return : (str) The printable address.
+
+        """
+        if family == socket.AF_INET:
+            return socket.inet_ntop(family, (int(low) & 0xFFFFFFFF).to_bytes(4, "big"))
+        return socket.inet_ntop(family, ((int(high) << 64) | int(low)).to_bytes(16, "big"))
@@ -0,0 +1,247 @@
+"""
+
+
+This module serves the bandwidth and connection counts of the processes as Prometheus metrics. A background thread
+collects on its own schedule and renders the whole response into one buffer, so a scrape only writes out the buffer
+that is already there and scrapes never trigger a collection, however many of them come in at once.
+
+usage: python main.py -exporter [--host 127.0.0.1] [--port 9101] [--interval 15]
+
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escapeLabel(value):
+    """
+
+    This function escapes a label value for the Prometheus text format.
+
+    :param value: The value.
+
+    :return : (str) The escaped value.
+
+    """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsCollector:
+    """
+
+    The MetricsCollector class collects the metrics in a daemon thread and keeps the last rendering as bytes. The
+    buffer is replaced as a whole, so a reader always gets a complete rendering without taking a lock.
+
+    """
+
+    def __init__(self, helper=None, pids=None, interval=15.0):
+        """
+
+        :param helper: (NetWorkHelper) The helper whose counter source is read, a new one by default.
+        :param pids: (list) The process ids to export, defaults to every process with a socket at each collection.
+        :param interval: (float) The time between two collections in seconds.
+
+        """
+        if helper is None:
+            from NetworkHelper import NetWorkHelper
+            helper = NetWorkHelper()
+        self.helper = helper
+        self.pids = pids
+        self.interval = interval
+        self.buffer = b""
+        self.errors = 0
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+
+        This method collects once, so the first scrape has data, and then keeps collecting in a daemon thread.
+
+        :return : (MetricsCollector) The collector itself.
+
+        """
+        self.collect()
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, name="MetricsCollector", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+
+        This method stops the collecting thread and waits for it to exit.
+
+        :param timeout: (float) The most seconds to wait.
+
+        """
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def run(self):
+        """
+
+        This method is the body of the collecting thread. It runs on a fixed schedule like BandwidthMonitor.run.
+
+        """
+        next_collection = time.monotonic() + self.interval
+        while not self.stopEvent.wait(max(next_collection - time.monotonic(), 0)):
+            self.collect()
+            next_collection += self.interval
+            if next_collection < time.monotonic():
+                next_collection = time.monotonic()
+
+    def collect(self):
+        """
+
+        This method collects the metrics and replaces the buffer. On an error the previous buffer is kept and the
+        error counter goes up.
+
+        """
+        start = time.perf_counter()
+        try:
+            body = self.render()
+        except Exception as e:
+            self.errors += 1
+            print(f"Something went wrong while collecting metrics: {e}")
+            return
+        duration = time.perf_counter() - start
+        body += (f"# HELP networkhelper_collection_duration_seconds The time the last collection took.\n"
+                 f"# TYPE networkhelper_collection_duration_seconds gauge\n"
+                 f"networkhelper_collection_duration_seconds {duration:.6f}\n"
+                 f"# HELP networkhelper_collection_errors_total The collections that failed.\n"
+                 f"# TYPE networkhelper_collection_errors_total counter\n"
+                 f"networkhelper_collection_errors_total {self.errors}\n"
+                 f"# HELP networkhelper_last_collection_timestamp_seconds The time of the last collection.\n"
+                 f"# TYPE networkhelper_last_collection_timestamp_seconds gauge\n"
+                 f"networkhelper_last_collection_timestamp_seconds {time.time():.3f}\n")
+        self.buffer = body.encode("utf-8")
+
+    def render(self):
+        """
+
+        This method reads the connections and the counters once and renders them in the Prometheus text format.
+
+        :return : (str) The metrics.
+
+        """
+        perPid = {}
+        perState = {}
+        for conn in self.helper.iterConnections():
+            perState[conn.state] = perState.get(conn.state, 0) + 1
+            if conn.pid is not None:
+                perPid[conn.pid] = perPid.get(conn.pid, 0) + 1
+        pids = [int(pid) for pid in self.pids] if self.pids else list(perPid)
+        counters = self.helper.counterSource(pids)
+        names = self.helper.getNames(pids)
+
+        lines = ["# HELP networkhelper_process_sent_bytes_total The bytes a process sent.",
+                 "# TYPE networkhelper_process_sent_bytes_total counter"]
+        labels = {pid: f'pid="{pid}",name="{escapeLabel(names.get(pid, ""))}"' for pid in pids}
+        lines.extend(f"networkhelper_process_sent_bytes_total{{{labels[pid]}}} {sent}"
+                     for pid, (sent, received) in counters.items() if pid in labels)
+        lines.append("# HELP networkhelper_process_received_bytes_total The bytes a process received.")
+        lines.append("# TYPE networkhelper_process_received_bytes_total counter")
+        lines.extend(f"networkhelper_process_received_bytes_total{{{labels[pid]}}} {received}"
+                     for pid, (sent, received) in counters.items() if pid in labels)
+        lines.append("# HELP networkhelper_process_connections The sockets a process has open.")
+        lines.append("# TYPE networkhelper_process_connections gauge")
+        lines.extend(f"networkhelper_process_connections{{{labels[pid]}}} {perPid.get(pid, 0)}" for pid in pids)
+        lines.append("# HELP networkhelper_connections The sockets of the system by state.")
+        lines.append("# TYPE networkhelper_connections gauge")
+        lines.extend(f'networkhelper_connections{{state="{escapeLabel(state)}"}} {count}'
+                     for state, count in sorted(perState.items()))
+
+        interfaces = psutil.net_io_counters(pernic=True)
+        lines.append("# HELP networkhelper_interface_sent_bytes_total The bytes an interface sent.")
+        lines.append("# TYPE networkhelper_interface_sent_bytes_total counter")
+        lines.extend(f'networkhelper_interface_sent_bytes_total{{interface="{escapeLabel(name)}"}} '
+                     f'{nic.bytes_sent}' for name, nic in interfaces.items())
+        lines.append("# HELP networkhelper_interface_received_bytes_total The bytes an interface received.")
+        lines.append("# TYPE networkhelper_interface_received_bytes_total counter")
+        lines.extend(f'networkhelper_interface_received_bytes_total{{interface="{escapeLabel(name)}"}} '
+                     f'{nic.bytes_recv}' for name, nic in interfaces.items())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+
+    The MetricsHandler class answers GET /metrics with the buffer of the collector of its server.
+
+    """
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        # Take the reference once, the collector may swap in a new buffer while this one is written.
+        body = self.server.collector.buffer
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes come in every few seconds, keep them out of the output.
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+
+    The MetricsServer class is a threading HTTP server that serves the metrics of one collector.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, collector):
+        self.collector = collector
+        super().__init__(address, MetricsHandler)
+
+
+def serve(host="127.0.0.1", port=9101, interval=15.0, helper=None):
+    """
+
+    This function starts the collector and serves its metrics until interrupted.
+
+    :param host: (str) The address to listen on.
+    :param port: (int) The port to listen on.
+    :param interval: (float) The time between two collections in seconds.
+    :param helper: (NetWorkHelper) The helper to collect with, a new one by default.
+
+    """
+    collector = MetricsCollector(helper, interval=interval).start()
+    server = MetricsServer((host, port), collector)
+    print(f"Serving metrics on http://{host}:{server.server_port}/metrics every {interval} seconds.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        collector.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py -exporter",
+                                     description="Serve NetWorkHelper metrics in the Prometheus text format.")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("--port", type=int, default=9101, help="the port to listen on")
+    parser.add_argument("--interval", type=float, default=15.0, help="the seconds between two collections")
+    options = parser.parse_args(argv)
+    serve(options.host, options.port, options.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+
+
+This module keeps track of the heaviest processes of a stream of bandwidth samples in a fixed amount of memory,
+using the Space-Saving algorithm of Metwally, Agrawal and El Abbadi. With a capacity of k counters every process
+that used more than 1/k of the total is guaranteed to be tracked, however many short-lived processes pass through.
+
+"""
+
+import heapq
+
+
+class SpaceSavingSketch:
+    """
+
+    The SpaceSavingSketch class counts the weight of the keys it sees in at most capacity counters. When a new key
+    arrives and the sketch is full, it takes over the smallest counter and remembers that counter's value as it's
+    possible overestimation.
+
+    """
+
+    def __init__(self, capacity=100):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        # key -> [count, error]
+        self.counters = {}
+        # A min-heap of (count, key) entries. It can hold stale entries, they are skipped when popped.
+        self.heap = []
+        self.total = 0
+
+    def update(self, key, weight=1):
+        """
+
+        This method adds weight to the counter of a key.
+
+        :param key: The key to count, such as a pid.
+        :param weight: (int) The weight to add, such as the bytes the process used in the last interval.
+
+        """
+        if weight <= 0:
+            return
+        self.total += weight
+        counter = self.counters.get(key)
+        if counter is None:
+            if len(self.counters) < self.capacity:
+                counter = self.counters[key] = [0, 0]
+            else:
+                minimum, evicted = self.popMinimum()
+                del self.counters[evicted]
+                counter = self.counters[key] = [minimum, minimum]
+        counter[0] += weight
+        heapq.heappush(self.heap, (counter[0], key))
+        if len(self.heap) > 4 * self.capacity:
+            self.compact()
+
+    def popMinimum(self):
+        """
+
+        This method removes the smallest counter from the heap.
+
+        :return : (int) The count of the smallest counter, and its key.
+
+        """
+        while True:
+            count, key = heapq.heappop(self.heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                return count, key
+
+    def compact(self):
+        """
+
+        This method rebuilds the heap without the stale entries so it stays proportional to the capacity.
+
+        """
+        self.heap = [(counter[0], key) for key, counter in self.counters.items()]
+        heapq.heapify(self.heap)
+
+    def top(self, n):
+        """
+
+        This method returns the n heaviest keys.
+
+        :param n: (int) The number of keys to return.
+
+        :return : (list) (key, count, error) tuples sorted by count, the count overestimates by at most error.
+
+        """
+        return [(key, counter[0], counter[1])
+                for key, counter in heapq.nlargest(n, self.counters.items(), key=lambda item: item[1][0])]
@@ -0,0 +1,201 @@
+"""
+
+
+This module measures where NetWorkHelper spends its time. It keeps per-stage timers, call counts, error counts and
+size counters such as rows parsed and pids resolved, and can hand every measurement to hooks as it happens. It is off
+by default, and while it is off a stage is a shared no-op context and a counter is one attribute check.
+
+"""
+
+import threading
+import time
+from contextlib import nullcontext
+
+# The context every stage gets while instrumentation is off.
+NULL_STAGE = nullcontext()
+
+
+class Stage:
+    """
+
+    The Stage class times one run of a stage, as a context manager. An exception that leaves the stage is counted as
+    an error of the stage.
+
+    """
+
+    __slots__ = ("instrumentation", "name", "start")
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.timing(self.name, time.perf_counter() - self.start)
+        if exc_value is not None:
+            self.instrumentation.error(self.name, exc_value)
+        return False
+
+
+class Instrumentation:
+    """
+
+    The Instrumentation class collects the measurements. Hooks are callables that take (event, name, value), where
+    event is "stage" with the seconds a stage took, "count" with the amount added to a counter, or "error" with the
+    exception.
+
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.hooks = []
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.errors = {}
+
+    def enable(self, enabled=True):
+        """
+
+        This method turns the instrumentation on or off. The collected measurements are kept.
+
+        :param enabled: (bool) True to turn it on, false to turn it off.
+
+        """
+        self.enabled = enabled
+
+    def reset(self):
+        """
+
+        This method clears every measurement.
+
+        """
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.errors = {}
+
+    def addHook(self, hook):
+        """
+
+        This method adds a hook that is called with every measurement while the instrumentation is on.
+
+        :param hook: (callable) Takes (event, name, value).
+
+        """
+        self.hooks.append(hook)
+
+    def removeHook(self, hook):
+        """
+
+        This method removes a hook.
+
+        :param hook: (callable) A hook that was added before.
+
+        """
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def notify(self, event, name, value):
+        """
+
+        This method calls the hooks. A failing hook is removed so it can not break the code it measures.
+
+        """
+        for hook in list(self.hooks):
+            try:
+                hook(event, name, value)
+            except Exception as e:
+                print(f"Removing instrumentation hook {hook!r}: {e}")
+                self.removeHook(hook)
+
+    def stage(self, name):
+        """
+
+        This method returns a context manager that times a stage.
+
+        :param name: (str) The name of the stage, such as netstat or getNames.
+
+        :return : (Stage) The context manager, a shared no-op one while the instrumentation is off.
+
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def timing(self, name, seconds):
+        """
+
+        This method records one run of a stage.
+
+        :param name: (str) The name of the stage.
+        :param seconds: (float) The time the run took.
+
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+        if self.hooks:
+            self.notify("stage", name, seconds)
+
+    def count(self, name, amount=1):
+        """
+
+        This method adds to a counter.
+
+        :param name: (str) The name of the counter, such as rows_parsed.
+        :param amount: (int) The amount to add.
+
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        if self.hooks:
+            self.notify("count", name, amount)
+
+    def error(self, name, exception):
+        """
+
+        This method counts an error.
+
+        :param name: (str) The stage or method the error happened in.
+        :param exception: (Exception) The error.
+
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        if self.hooks:
+            self.notify("error", name, exception)
+
+    def stats(self):
+        """
+
+        This method returns a copy of the measurements.
+
+        :return : (dict) With "stages" mapping every stage to its calls, total, mean and max seconds, "counters"
+        mapping every counter to its value and "errors" mapping every stage to its number of errors.
+
+        """
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "stages": {name: {"calls": calls, "total": total, "mean": total / calls, "max": longest}
+                           for name, (calls, total, longest) in self.timers.items()},
+                "counters": dict(self.counters),
+                "errors": dict(self.errors),
+            }
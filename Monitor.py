@@ -0,0 +1,363 @@
+"""
+
+
+This module runs NetWorkHelper's sampling in the background and keeps the history of every process and interface in
+fixed-size ring buffers, so dashboards can ask for recent rates without waiting for a new interval to elapse.
+
+"""
+
+import math
+import threading
+import time
+from array import array
+
+import psutil
+
+
+class RingBuffer:
+    """
+
+    The RingBuffer class stores the last capacity numbers in a preallocated array, overwriting the oldest one.
+
+    """
+
+    def __init__(self, capacity, typecode="d"):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.data = array(typecode, bytes(array(typecode).itemsize * capacity))
+        # The index the next value is written to, and the number of values stored.
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        """
+
+        This method stores a value, overwriting the oldest one when the buffer is full.
+
+        :param value: The number to store.
+
+        """
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def last(self, n=None):
+        """
+
+        This method returns the newest values, oldest first.
+
+        :param n: (int) The number of values to return, defaults to all of them.
+
+        :return : (list) The values.
+
+        """
+        if n is None or n > self.count:
+            n = self.count
+        start = (self.head - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.data[start:start + n].tolist()
+        return self.data[start:].tolist() + self.data[:self.head].tolist()
+
+
+class BandwidthSeries:
+    """
+
+    The BandwidthSeries class holds the sample times and the bytes sent and received of one process or interface.
+
+    """
+
+    def __init__(self, capacity):
+        self.times = RingBuffer(capacity, "d")
+        self.elapsed = RingBuffer(capacity, "d")
+        self.sent = RingBuffer(capacity, "Q")
+        self.received = RingBuffer(capacity, "Q")
+        self.lastSeen = 0.0
+
+    def append(self, timestamp, elapsed_time, bytes_sent, bytes_received):
+        """
+
+        This method stores one sample.
+
+        :param timestamp: (float) The time the sample ended.
+        :param elapsed_time: (float) The length of the sample in seconds.
+        :param bytes_sent: (int) The bytes sent during the sample.
+        :param bytes_received: (int) The bytes received during the sample.
+
+        """
+        self.times.append(timestamp)
+        self.elapsed.append(elapsed_time)
+        self.sent.append(max(bytes_sent, 0))
+        self.received.append(max(bytes_received, 0))
+        self.lastSeen = timestamp
+
+    def window(self, seconds=None, now=None):
+        """
+
+        This method returns the samples that ended within the last seconds.
+
+        :param seconds: (float) The length of the window, defaults to the whole history.
+        :param now: (float) The end of the window, defaults to the current time, so a series that stopped reporting
+            has an empty window once its samples are older than the window.
+
+        :return : (list) (timestamp, elapsed_time, bytes_sent, bytes_received) tuples, oldest first.
+
+        """
+        samples = list(zip(self.times.last(), self.elapsed.last(), self.sent.last(), self.received.last()))
+        if seconds is None or not samples:
+            return samples
+        if now is None:
+            now = time.time()
+        return [sample for sample in samples if sample[0] > now - seconds]
+
+
+class BandwidthMonitor:
+    """
+
+    The BandwidthMonitor class samples the per-process counters of a NetWorkHelper and the per-interface counters of
+    psutil on one clock, in a background thread, and answers queries about their recent history.
+
+    """
+
+    def __init__(self, helper=None, pids=None, interval=1.0, history=3600, max_series=10000, recorder=None):
+        """
+
+        :param helper: (NetWorkHelper) The helper whose counter source is sampled, a new one by default.
+        :param pids: (list) The process ids to follow, defaults to every process with a socket at each tick.
+        :param interval: (float) The time between two samples in seconds.
+        :param history: (int) The number of samples kept per process and interface.
+        :param max_series: (int) The most processes and interfaces kept, the ones not seen for longest are dropped.
+        :param recorder: (SampleRecorder) Optional recorder every sample is also appended to.
+
+        """
+        if helper is None:
+            # Imported here so this module can be imported by NetworkHelper itself.
+            from NetworkHelper import NetWorkHelper
+            helper = NetWorkHelper()
+        self.helper = helper
+        self.pids = pids
+        self.interval = interval
+        self.history = history
+        self.max_series = max_series
+        self.recorder = recorder
+        self.pidSeries = {}
+        self.interfaceSeries = {}
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.thread = None
+        self.previousPids = None
+        self.previousInterfaces = None
+        self.previousTime = None
+
+    def start(self):
+        """
+
+        This method starts sampling in a daemon thread.
+
+        :return : (BandwidthMonitor) The monitor itself.
+
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return self
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, name="BandwidthMonitor", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+
+        This method stops the sampling thread and waits for it to exit.
+
+        :param timeout: (float) The most seconds to wait.
+
+        """
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def run(self):
+        """
+
+        This method is the body of the sampling thread. It ticks on a fixed schedule so a slow tick does not shift the
+        ones after it.
+
+        """
+        next_tick = time.monotonic()
+        while not self.stopEvent.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Something went wrong while sampling: {e}")
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # We fell behind, skip the ticks we missed instead of bunching them up.
+                next_tick = time.monotonic()
+                delay = 0
+            self.stopEvent.wait(delay)
+
+    def tick(self):
+        """
+
+        This method takes one snapshot of all the counters and stores the change since the previous snapshot.
+
+        """
+        pids = self.pids if self.pids else list(self.helper.iterConnections().pids())
+        pidCounters = self.helper.counterSource(pids)
+        interfaceCounters = {name: (counters.bytes_sent, counters.bytes_recv)
+                             for name, counters in psutil.net_io_counters(pernic=True).items()}
+        now = time.time()
+
+        with self.lock:
+            if self.previousTime is not None:
+                elapsed_time = now - self.previousTime
+                self.store(self.pidSeries, pidCounters, self.previousPids, now, elapsed_time)
+                self.store(self.interfaceSeries, interfaceCounters, self.previousInterfaces, now, elapsed_time,
+                           "interface")
+                if self.recorder is not None:
+                    self.recorder.flush()
+            self.previousPids, self.previousInterfaces, self.previousTime = pidCounters, interfaceCounters, now
+
+    def store(self, seriesMap, current, previous, now, elapsed_time, kind="pid"):
+        """
+
+        This method appends the deltas between two snapshots to their series, creating and evicting series as needed.
+
+        """
+        for key, (bytes_sent, bytes_received) in current.items():
+            if key not in previous:
+                continue
+            start_sent, start_received = previous[key]
+            self.appendSample(seriesMap, kind, key, now, elapsed_time, bytes_sent - start_sent,
+                              bytes_received - start_received)
+        self.evict(seriesMap)
+
+    def appendSample(self, seriesMap, kind, key, now, elapsed_time, bytes_sent, bytes_received):
+        """
+
+        This method appends one sample to the series of a process or interface, and to the recorder if there is one.
+        The caller has to hold the lock.
+
+        """
+        series = seriesMap.get(key)
+        if series is None:
+            series = seriesMap[key] = BandwidthSeries(self.history)
+        series.append(now, elapsed_time, bytes_sent, bytes_received)
+        if self.recorder is not None:
+            if kind == "pid":
+                self.recorder.append(key, bytes_sent, bytes_received, elapsed_time, now)
+            else:
+                self.recorder.append(0, bytes_sent, bytes_received, elapsed_time, now, key)
+
+    def evict(self, seriesMap):
+        """
+
+        This method drops the series that were not seen for longest when there are more than max_series of them.
+
+        """
+        if len(seriesMap) > self.max_series:
+            for key in sorted(seriesMap, key=lambda key: seriesMap[key].lastSeen)[:len(seriesMap) - self.max_series]:
+                del seriesMap[key]
+
+    def getSeries(self, kind, key):
+        """
+
+        This method finds the series of a process or interface. The caller has to hold the lock.
+
+        :param kind: (str) pid or interface.
+        :param key: The pid or the interface name.
+
+        :return : (BandwidthSeries) The series, or None if there is none.
+
+        """
+        if kind not in ("pid", "interface"):
+            raise ValueError("Invalid kind. Please use one of the following: pid, interface.")
+        seriesMap = self.pidSeries if kind == "pid" else self.interfaceSeries
+        if kind == "pid":
+            key = int(key)
+        return seriesMap.get(key)
+
+    def getRate(self, key, window=1, kind="pid"):
+        """
+
+        This method returns the average send and receive rate over the last window seconds.
+
+        :param key: The pid, or the interface name when kind is interface.
+        :param window: (float) The window in seconds, such as 1, 10 or 60.
+        :param kind: (str) pid or interface.
+
+        :return : (float) The bytes sent per second, (float) the bytes received per second. Both are 0 when there are
+        no samples in the window.
+
+        """
+        with self.lock:
+            series = self.getSeries(kind, key)
+            samples = series.window(window) if series is not None else []
+        elapsed_time = sum(sample[1] for sample in samples)
+        if not elapsed_time:
+            return 0.0, 0.0
+        return sum(sample[2] for sample in samples) / elapsed_time, sum(sample[3] for sample in samples) / elapsed_time
+
+    def getStats(self, key, window=60, kind="pid", percentiles=(50, 95, 99)):
+        """
+
+        This method returns the min, max and percentiles of the per-sample rates over the last window seconds.
+
+        :param key: The pid, or the interface name when kind is interface.
+        :param window: (float) The window in seconds.
+        :param kind: (str) pid or interface.
+        :param percentiles: (tuple) The percentiles to compute.
+
+        :return : (dict) sent and received dicts with min, max and a p<percentile> entry per percentile, or None
+        when there are no samples in the window.
+
+        """
+        with self.lock:
+            series = self.getSeries(kind, key)
+            samples = series.window(window) if series is not None else []
+        if not samples:
+            return None
+        stats = {}
+        for name, column in (("sent", 2), ("received", 3)):
+            rates = sorted(sample[column] / sample[1] for sample in samples if sample[1])
+            if not rates:
+                return None
+            stats[name] = {"min": rates[0], "max": rates[-1]}
+            for percentile in percentiles:
+                stats[name][f"p{percentile}"] = rates[max(math.ceil(percentile / 100 * len(rates)) - 1, 0)]
+        return stats
+
+    def getHistory(self, key, window=None, kind="pid"):
+        """
+
+        This method returns the stored samples of a process or interface.
+
+        :param key: The pid, or the interface name when kind is interface.
+        :param window: (float) Optional window in seconds, defaults to the whole history.
+        :param kind: (str) pid or interface.
+
+        :return : (list) (timestamp, elapsed_time, bytes_sent, bytes_received) tuples, oldest first.
+
+        """
+        with self.lock:
+            series = self.getSeries(kind, key)
+            return series.window(window) if series is not None else []
+
+    def getKeys(self, kind="pid"):
+        """
+
+        This method lists the processes or interfaces that have a history.
+
+        :param kind: (str) pid or interface.
+
+        :return : (list) The pids or the interface names.
+
+        """
+        with self.lock:
+            return list(self.pidSeries if kind == "pid" else self.interfaceSeries)
@@ -0,0 +1,128 @@
+"""
+
+
+This module caches process names so repeated lookups of the same PID do not build a new psutil.Process every time.
+Entries are keyed on the PID and validated against the process start time on every lookup, so a PID that the system
+reused for a new process is detected and resolved again.
+
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import psutil
+
+
+def processStartTime(pid, proc_root="/proc"):
+    """
+
+    This function reads the start time of a process, which tells a reused PID apart from the process that had it
+    before. On Linux it is one read of /proc/<pid>/stat, elsewhere it goes through psutil.
+
+    :param pid: (int) The process id.
+    :param proc_root: (str) The mount point of the proc filesystem.
+
+    :return : The start time, only meant to be compared with another start time of the same pid.
+
+    :raises psutil.NoSuchProcess: If the process does not exist.
+
+    """
+    try:
+        with open(os.path.join(proc_root, str(pid), "stat"), "rb") as stat:
+            data = stat.read()
+    except FileNotFoundError:
+        raise psutil.NoSuchProcess(pid)
+    except OSError:
+        return psutil.Process(pid).create_time()
+    # The name in the second field can hold spaces and parentheses, the start time is the 20th field after it.
+    return data[data.rindex(b")") + 2:].split()[19]
+
+
+class ProcessNameCache:
+    """
+
+    The ProcessNameCache class is a bounded LRU cache of process names with a time to live.
+
+    Every hit is checked against the start time of the process, which is one small read, so a PID that was reused is
+    always resolved again. An entry older than ttl seconds has its name read again, which catches a process that
+    renamed itself.
+
+    """
+
+    def __init__(self, max_size=4096, ttl=30.0, proc_root="/proc"):
+        """
+
+        :param max_size: (int) The most names kept, the least recently used ones are dropped.
+        :param ttl: (float) The seconds after which the name of a process is read again.
+        :param proc_root: (str) The mount point of the proc filesystem.
+
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.proc_root = proc_root
+        # pid -> [start_time, name, resolved_at]
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, pid):
+        """
+
+        This method returns the name of a process, from the cache when it is still valid.
+
+        :param pid: (int) The process id to retrieve the name for.
+
+        :return : (str) The name of the process. psutil errors are raised when the process does not exist.
+
+        """
+        pid = int(pid)
+        now = time.monotonic()
+        start_time = processStartTime(pid, self.proc_root)
+        with self.lock:
+            entry = self.entries.get(pid)
+            if entry is not None and entry[0] == start_time and now - entry[2] < self.ttl:
+                self.entries.move_to_end(pid)
+                self.hits += 1
+                return entry[1]
+
+        name = psutil.Process(pid).name()
+        with self.lock:
+            self.misses += 1
+            self.entries[pid] = [start_time, name, now]
+            self.entries.move_to_end(pid)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return name
+
+    def invalidate(self, pid=None):
+        """
+
+        This method drops one entry from the cache, or every entry when no pid is given.
+
+        :param pid: (int) Optional process id to forget.
+
+        """
+        with self.lock:
+            if pid is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(int(pid), None)
+
+    def stats(self):
+        """
+
+        This method returns the counters of the cache.
+
+        :return : (dict) The hits, misses, evictions and current size of the cache.
+
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": len(self.entries)}
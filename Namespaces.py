@@ -0,0 +1,164 @@
+"""
+
+
+This module samples the interface counters of network namespaces, such as the ones of containers. Processes are
+grouped by the inode of their /proc/<pid>/ns/net link, and /proc/<pid>/net/dev is read once per namespace through
+any one of its processes, so sampling thousands of processes in a few pods costs one read per pod.
+
+"""
+
+import os
+import time
+
+# The loopback interface is named lo in every namespace.
+LOOPBACK = "lo"
+
+
+class NamespaceSampler:
+    """
+
+    The NamespaceSampler class reads the interface counters of every network namespace the given processes are in.
+
+    """
+
+    def __init__(self, proc_root="/proc", include_loopback=True):
+        self.proc_root = proc_root
+        self.include_loopback = include_loopback
+
+    def getNamespace(self, pid):
+        """
+
+        This method finds the network namespace of a process.
+
+        :param pid: (int) The process id.
+
+        :return : (int) The inode of the namespace, or None if the process exited or can not be inspected.
+
+        """
+        try:
+            return os.stat(os.path.join(self.proc_root, str(pid), "ns", "net")).st_ino
+        except OSError:
+            return None
+
+    def groupByNamespace(self, pids):
+        """
+
+        This method groups processes by their network namespace.
+
+        :param pids: (list) The process ids.
+
+        :return : (dict) The namespace inodes as keys and lists of their pids as values.
+
+        """
+        groups = {}
+        for pid in dict.fromkeys(int(pid) for pid in pids):
+            namespace = self.getNamespace(pid)
+            if namespace is not None:
+                groups.setdefault(namespace, []).append(pid)
+        return groups
+
+    def readNetDev(self, pid):
+        """
+
+        This method reads the interface counters of the namespace a process is in.
+
+        :param pid: (int) Any process in the namespace.
+
+        :return : (dict) The interface names as keys and (bytes_sent, bytes_received) tuples as values, or None if
+        the process exited.
+
+        """
+        try:
+            with open(os.path.join(self.proc_root, str(pid), "net", "dev"), "r") as netDev:
+                lines = netDev.read().splitlines()
+        except OSError:
+            return None
+        interfaces = {}
+        # The first two lines are the column headers.
+        for line in lines[2:]:
+            name, _, counters = line.partition(":")
+            name = name.strip()
+            if not self.include_loopback and name == LOOPBACK:
+                continue
+            fields = counters.split()
+            if len(fields) >= 9:
+                # The receive columns come first, bytes_sent is the first transmit column.
+                interfaces[name] = (int(fields[8]), int(fields[0]))
+        return interfaces
+
+    def snapshot(self, pids):
+        """
+
+        This method reads the interface counters of every namespace the processes are in, once per namespace.
+
+        :param pids: (list) The process ids.
+
+        :return : (dict) The namespace inodes as keys, and dicts with the pids of the namespace and the counters of
+        its interfaces as values.
+
+        """
+        namespaces = {}
+        for namespace, members in self.groupByNamespace(pids).items():
+            # Any member can be used to read the namespace, try the next one if it exited in the meantime.
+            for pid in members:
+                interfaces = self.readNetDev(pid)
+                if interfaces is not None:
+                    namespaces[namespace] = {"pids": members, "interfaces": interfaces}
+                    break
+        return namespaces
+
+    def counters(self, pids):
+        """
+
+        This method gives every process the total counters of its namespace, so it can be used as the counter source
+        of a NetWorkHelper.
+
+        :param pids: (list) The process ids to read the counters for.
+
+        :return : (dict) The pids as keys and (bytes_sent, bytes_received) tuples as values.
+
+        """
+        result = {}
+        for namespace in self.snapshot(pids).values():
+            interfaces = namespace["interfaces"].values()
+            total = (sum(counters[0] for counters in interfaces), sum(counters[1] for counters in interfaces))
+            for pid in namespace["pids"]:
+                result[pid] = total
+        return result
+
+    def sample(self, pids, interval):
+        """
+
+        This method measures the traffic of every namespace and interface over an interval.
+
+        :param pids: (list) The process ids whose namespaces should be measured.
+        :param interval: (float) The interval or the time to elapse.
+
+        :return : (dict) The namespace inodes as keys, and dicts with the pids, the elapsed time, the
+        (bytes_sent, bytes_received) of every interface and the total of the namespace as values.
+
+        """
+        start = self.snapshot(pids)
+        start_time = time.time()
+        time.sleep(interval)
+        end = self.snapshot(pids)
+        elapsed_time = time.time() - start_time
+
+        result = {}
+        for namespace, current in end.items():
+            previous = start.get(namespace)
+            if previous is None:
+                continue
+            interfaces = {}
+            for name, (bytes_sent, bytes_received) in current["interfaces"].items():
+                if name in previous["interfaces"]:
+                    start_sent, start_received = previous["interfaces"][name]
+                    interfaces[name] = (bytes_sent - start_sent, bytes_received - start_received)
+            result[namespace] = {
+                "pids": current["pids"],
+                "elapsed_time": elapsed_time,
+                "interfaces": interfaces,
+                "total": (sum(delta[0] for delta in interfaces.values()),
+                          sum(delta[1] for delta in interfaces.values())),
+            }
+        return result
@@ -7,12 +7,25 @@ system. It uses the subprocess and psutil modules to run commands and interact w
 """
 
 import concurrent.futures
+import heapq
 import json
 import subprocess
 import time
 
 import psutil
 
+from Columnar import ColumnarSnapshot
+from HeavyHitters import SpaceSavingSketch
+from Instrumentation import Instrumentation
+from Monitor import BandwidthMonitor
+from NameCache import ProcessNameCache
+from Namespaces import NamespaceSampler
+from ProcNet import ProcNetReader
+from Results import BandwidthResult, unitFromArgs
+from Scheduler import AdaptiveScheduler
+from Snapshots import ConnectionTracker
+from SockDiag import SockDiagCollector
+
 """
 
 The program defines a custom exception class, TooManyArgsError and insufficientArgsError, which can be raised when 
@@ -31,7 +44,6 @@ class insufficientArgsError(Exception):
 
 # TODO:
 #   Make The programing more generic and dynamic.
-#   getBandwidth() Method to calculate for multiply PID's and sort them by highest usage.
 class NetWorkHelper:
     """
 
@@ -39,32 +51,83 @@ class NetWorkHelper:
 
     """
 
-    def __init__(self):
+    # The process names cache shared by getNames, getNameById and getProcesses.
+    nameCache = ProcessNameCache()
+    # The timers and counters of the hot paths, off until enableInstrumentation is called.
+    instrumentation = Instrumentation()
+
+    def __init__(self, counters="auto", include_loopback=True):
+        """
+
+        :param counters: (str) Where the bandwidth of a process is read from, one of:
+            auto: socket when the kernel offers it, system otherwise.
+            socket: the bytes of the process's own TCP sockets, through netlink sock_diag.
+            namespace: the interface counters of the network namespace the process is in, such as its container.
+            system: the system wide interface counters, the same for every process.
+        :param include_loopback: (bool) True to count the loopback interface with the namespace counters, false if not.
+
+        """
         netstatOutput = "no"
         process_name = ""
+        # Callable that takes a list of pids and returns their (bytes_sent, bytes_received) counters.
+        if counters == "auto":
+            counters = "socket" if SockDiagCollector.isSupported() else "system"
+        if counters == "socket":
+            self.counterSource = SockDiagCollector().counters
+        elif counters == "namespace":
+            self.counterSource = NamespaceSampler(include_loopback=include_loopback).counters
+        elif counters == "system":
+            self.counterSource = self.systemCounters
+        else:
+            raise ValueError("Invalid counters. Please use one of the following: auto, socket, namespace, system.")
 
     # TODO:
     #   Return different outputs for different args for the netstat command.
     @staticmethod
-    def netstat():
+    def netstat(native=None, filters=None):
         """
 
         This method gets the result of running the netstat command and returns it as a string.
 
+        :param native: (bool) True to read the /proc/net socket tables directly, false to run the netstat command.
+            Defaults to reading /proc/net when it is available.
+        :param filters: (ConnectionFilter) Optional filter, only the connections that match are returned.
+
         :return: A string containing the output of the netstat command.
 
         """
 
-        returnString = ""
+        if native is None:
+            native = ProcNetReader.isSupported()
+        if native:
+            with NetWorkHelper.instrumentation.stage("netstat.proc"):
+                return ProcNetReader.formatConnections(NetWorkHelper.iterConnections(filters=filters))
+
         # this is the executable command for the netstat.
         # The args -no are used to show the PID and to stop the run.
-        process = subprocess.Popen(['netstat', '-no'], stdout=subprocess.PIPE)
-        while True:
-            output = process.stdout.readline()
-            if output == b'' and process.poll() is not None:
-                break
-            returnString = returnString + output.decode("UTF-8").strip() + "\n"
-        return returnString.strip()
+        with NetWorkHelper.instrumentation.stage("netstat.fork"):
+            process = subprocess.run(['netstat', '-no'], stdout=subprocess.PIPE)
+        lines = [line.strip() for line in process.stdout.decode("UTF-8").splitlines()]
+        if filters is not None:
+            lines = [line for line in lines if NetWorkHelper.lineMatches(line, filters)]
+        return "\n".join(lines).strip()
+
+    @staticmethod
+    def lineMatches(line, filters):
+        """
+
+        This method checks a line of netstat output against a filter. Lines that are not connections are kept.
+
+        :param line: (str) The line to check.
+        :param filters: (ConnectionFilter) The filter to check the line against.
+
+        :return : (bool) True if the line should be kept.
+
+        """
+        conn = ProcNetReader.parseNetstatLine(line)
+        if conn is None:
+            return True
+        return filters.matches(conn) and filters.matchesName(conn.pid, NetWorkHelper.nameCache.get)
 
     @staticmethod
     def getNames(pidList, nameList=None):
@@ -79,13 +142,18 @@ class NetWorkHelper:
         """
         if nameList is None:
             nameList = {}
-        for pid in pidList:
-            try:
-                process = psutil.Process(int(pid))
-                process_name = process.name()
-                nameList[pid] = process_name
-            except Exception as e:
-                print(f"Something went wrong: {e} check netstat output.")
+        instrumentation = NetWorkHelper.instrumentation
+        with instrumentation.stage("getNames"):
+            for pid in pidList:
+                # A PID shows up once per socket it owns, so only resolve each one once.
+                if pid in nameList:
+                    continue
+                try:
+                    nameList[pid] = NetWorkHelper.nameCache.get(pid)
+                    instrumentation.count("pids_resolved")
+                except Exception as e:
+                    instrumentation.error("getNames", e)
+                    print(f"Something went wrong: {e} check netstat output.")
 
         return nameList
 
@@ -101,14 +169,100 @@ class NetWorkHelper:
 
         """
         try:
-            process = psutil.Process(int(pid))
-            return process.name()
+            return NetWorkHelper.nameCache.get(pid)
         except Exception as e:
+            NetWorkHelper.instrumentation.error("getNameById", e)
             print(f"Something went wrong: {e} check process Id.")
 
+    @staticmethod
+    def iterConnections(protocols=None, resolve_pids=True, filters=None):
+        """
+
+        This method streams the connections of the system one parsed record at a time.
+
+        :param protocols: (list) The socket tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param resolve_pids: (bool) True if you want the pid of every connection, false if not.
+        :param filters: (ConnectionFilter) Optional filter. It is checked while the tables are parsed, and the pids and
+            names are only looked up for the rows that match.
+
+        :return : (ConnectionStream) A lazy stream of Connection records that filter and map stages can be chained on.
+
+        """
+        if filters is not None and filters.names is not None:
+            resolve_pids = True
+        stream = ProcNetReader(instrumentation=NetWorkHelper.instrumentation).iterConnections(protocols, resolve_pids,
+                                                                                              filters)
+        if filters is not None and filters.names is not None:
+            stream = stream.filter(lambda conn: filters.matchesName(conn.pid, NetWorkHelper.nameCache.get))
+        return stream
+
+    @staticmethod
+    def getColumnarSnapshot(protocols=None, resolve_pids=True):
+        """
+
+        This method reads the connections into a columnar snapshot of NumPy arrays, for fast counting and filtering
+        by pid, port or state. It needs NumPy to be installed.
+
+        :param protocols: (list) The socket tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param resolve_pids: (bool) True if you want the pid of every connection, false if not.
+
+        :return : (ColumnarSnapshot) The snapshot.
+
+        """
+        return ColumnarSnapshot.capture(ProcNetReader(instrumentation=NetWorkHelper.instrumentation), protocols,
+                                        resolve_pids)
+
+    @staticmethod
+    def trackConnections(protocols=None, filters=None, resolve_names=True):
+        """
+
+        This method creates a tracker whose poll() returns only the connections that opened, closed or changed state
+        since the previous poll. The pids and names are only looked up for the connections that opened.
+
+        :param protocols: (list) The socket tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param filters: (ConnectionFilter) Optional filter the connections have to match.
+        :param resolve_names: (bool) True if you want the names of the processes of the opened connections. Names
+            are always looked up when the filter has a names criterion.
+
+        :return : (ConnectionTracker) The tracker.
+
+        """
+        if filters is not None and filters.names is not None:
+            resolve_names = True
+        return ConnectionTracker(ProcNetReader(instrumentation=NetWorkHelper.instrumentation), protocols, filters,
+                                 NetWorkHelper.nameCache.get if resolve_names else None)
+
+    def iterPids(self, netstatOutput="no", filters=None):
+        """
+
+        This method yields the pid of every connection, once per socket, as strings.
+
+        :param netstatOutput: (str): Optional output of previews netstat command.
+        :param filters: (ConnectionFilter) Optional filter the connections have to match.
+
+        :return : (generator) The process ids.
+
+        """
+        if netstatOutput == "no" and ProcNetReader.isSupported():
+            # Skip the text round trip and take the PIDs straight from the socket tables.
+            for conn in self.iterConnections(filters=filters):
+                if conn.pid is not None:
+                    yield str(conn.pid)
+            return
+        if netstatOutput == "no":
+            netstatOutput = self.netstat()
+        for line in netstatOutput.splitlines():
+            if line.startswith("TCP") or line.startswith("UDP"):
+                words = line.split()
+                if not words[-1].isdigit():
+                    continue
+                if filters is not None and not self.lineMatches(line, filters):
+                    continue
+                yield words[-1]
+
     # TODO:
-    #   Sort and filter processes.
-    def getProcesses(self, netstatOutput="no", args=None):
+    #   Sort processes.
+    def getProcesses(self, netstatOutput="no", args=None, filters=None):
         """
 
         This method gets the process ids and/or names and ids or the normal netstat output if there are no arguments.
@@ -117,6 +271,8 @@ class NetWorkHelper:
         :param args: (list) A list of arguments that could be either:
             -name or -n: to show the PID and the names of the processes.
             -PID: to show just the PID of the processes.
+        :param filters: (ConnectionFilter) Optional filter on protocol, ports, addresses, state and process name. Only
+            the connections that match are looked up and returned.
 
         :return : (str) returns the normal netstat command if there are no arguments.
 
@@ -128,28 +284,30 @@ class NetWorkHelper:
             args = []
         if not isinstance(args, list):
             raise TypeError("args must be a list")
-        if netstatOutput == "no":
-            netstatOutput = self.netstat()
         if not args:
+            if netstatOutput == "no":
+                netstatOutput = self.netstat(filters=filters)
+            elif filters is not None:
+                netstatOutput = "\n".join(line for line in netstatOutput.splitlines()
+                                           if self.lineMatches(line, filters))
             # TODO:
             #   Return netstatoutput when arg is "-o" or "-output" other idk what to return.
             return netstatOutput
 
         else:
-            pidList = []
             nameList = {}
-            for line in netstatOutput.splitlines():
-                if line.startswith("TCP") or line.startswith("UDP"):
-                    words = line.split()
-                    pidList.append(words[-1])
+            # The PIDs are streamed, and only collected into a list when the output needs all of them.
+            pidList = self.iterPids(netstatOutput, filters)
             if len(args) > 1:
-                for arg in args:
-                    if arg == "-name" or arg == "-n":
-                        returnMsg = returnMsg + f" for the argument, {arg}:\n" \
-                                    + json.dumps(self.getNames(pidList, nameList)) + "\n\n"
-                    elif arg == "-pid":
-                        returnMsg = returnMsg + f" for the argument, {arg}:\n" + \
-                                    ", ".join(pidList) + "\n\n"
+                pidList = list(pidList)
+                with self.instrumentation.stage("getProcesses.format"):
+                    for arg in args:
+                        if arg == "-name" or arg == "-n":
+                            returnMsg = returnMsg + f" for the argument, {arg}:\n" \
+                                        + json.dumps(self.getNames(pidList, nameList)) + "\n\n"
+                        elif arg == "-pid":
+                            returnMsg = returnMsg + f" for the argument, {arg}:\n" + \
+                                        ", ".join(pidList) + "\n\n"
                 if returnMsg == "no":
                     return None
                 else:
@@ -158,13 +316,12 @@ class NetWorkHelper:
                 if "-name" in args or "-n" in args:
                     return self.getNames(pidList, nameList)
                 elif "-pid" in args:
-                    return pidList
+                    return list(pidList)
                 else:
                     print(
                         "Invalid argument. Please use one of the following: -name/-n, -pid.")
 
-    @staticmethod
-    def calcBandwidthInterval(pid, interval):
+    def calcBandwidthInterval(self, pid, interval):
         """
 
         This method takes a process id and returns the total bytes sent and received by the process over an elapsed time.
@@ -176,31 +333,110 @@ class NetWorkHelper:
         :return : (int) The elapsed time for the calculation, (int) The total bytes sent in the interval, (int) the
         total bytes received in the interval.
 
+        :raises psutil.NoSuchProcess: If the process does not exist or exited during the interval.
+        :raises psutil.AccessDenied: If the counter source could not read the counters of the process.
+
 
         """
         try:
             process = psutil.Process(int(pid))
+            samples = self.calcBandwidthBatch([process.pid], interval)[process.pid]
+            if not samples:
+                # The counter source did not report the process, it either went away while it was being sampled or
+                # its counters can not be read, such as the namespace of another user's process.
+                if process.is_running():
+                    error = psutil.AccessDenied(process.pid, msg="the counters of the process could not be read")
+                else:
+                    error = psutil.NoSuchProcess(process.pid, msg="the process exited during the interval")
+                self.instrumentation.error("calcBandwidthInterval", error)
+                raise error
+            return samples[0]
+        except ValueError as e:
+            self.instrumentation.error("calcBandwidthInterval", e)
+            print("The PID Must Be an integer.")
 
-            start_io_counters = psutil.net_io_counters()
-            start_time = time.time()
+    @staticmethod
+    def systemCounters(pids):
+        """
 
-            # Wait for some time to elapse
-            time.sleep(interval)
+        This method reads the system wide network counters and hands the same value to every pid.
 
-            end_io_counters = psutil.net_io_counters()
-            end_time = time.time()
+        :param pids: (list) The process ids to read the counters for.
 
-            elapsed_time = end_time - start_time
-            total_bytes_sent = end_io_counters.bytes_sent - start_io_counters.bytes_sent
-            total_bytes_received = end_io_counters.bytes_recv - start_io_counters.bytes_recv
-            return elapsed_time, total_bytes_sent, total_bytes_received
-        except ValueError:
-            print("The PID Must Be an integer.")
+        :return : (dict) The pids as keys and (bytes_sent, bytes_received) tuples as values.
 
-    # TODO:
-    #   Return the calculations instead of just printing it.
-    #   Return Total bytes sent and received in interval or per second.
-    def getBandwidthById(self, pid, interval=10, elapsed=True, args=None, print_output=True):
+        """
+        io_counters = psutil.net_io_counters()
+        counters = (io_counters.bytes_sent, io_counters.bytes_recv)
+        return {pid: counters for pid in pids}
+
+    def calcBandwidthBatch(self, pids, interval, ticks=1):
+        """
+
+        This method samples the counters of many processes on one shared clock. It takes one snapshot for all of the
+        pids, waits once, takes the next snapshot and so on, so the time it takes does not grow with the number of pids.
+
+        :param pids: (list) The process ids to calculate the bandwidth for.
+        :param interval: (int) The interval or the time to elapse.
+        :param ticks: (int) The number of equal steps to split the interval in, 1 for a single elapsed sample.
+
+        :return : (dict) The pids as keys and lists of (elapsed_time, bytes_sent, bytes_received) tuples as values,
+        one per tick.
+
+
+        """
+        pids = list(dict.fromkeys(int(pid) for pid in pids))
+        samples = {pid: [] for pid in pids}
+        step = interval / ticks
+        instrumentation = self.instrumentation
+        instrumentation.count("pids_sampled", len(pids))
+
+        with instrumentation.stage("counters"):
+            previous = self.counterSource(pids)
+        previous_time = time.time()
+        for _ in range(ticks):
+            time.sleep(step)
+            with instrumentation.stage("counters"):
+                current = self.counterSource(pids)
+            current_time = time.time()
+            self.addSamples(samples, previous, current, current_time - previous_time)
+            previous, previous_time = current, current_time
+        return samples
+
+    @staticmethod
+    def addSamples(samples, previous, current, elapsed_time):
+        """
+
+        This method appends the change between two counter snapshots to the samples of every pid in both of them.
+
+        :param samples: (dict) The pids as keys and lists of samples as values, updated in place.
+        :param previous: (dict) The earlier snapshot, pids as keys and (bytes_sent, bytes_received) as values.
+        :param current: (dict) The later snapshot.
+        :param elapsed_time: (float) The time between the two snapshots.
+
+        """
+        for pid, (bytes_sent, bytes_received) in current.items():
+            if pid in previous and pid in samples:
+                start_sent, start_received = previous[pid]
+                samples[pid].append((elapsed_time, bytes_sent - start_sent, bytes_received - start_received))
+
+    def takeSample(self, pid, interval, samples=None):
+        """
+
+        This method returns the next pre-collected sample if there is one, or measures a new one.
+
+        :param pid: (int) The process id to calculate it's bandwidth.
+        :param interval: (int) The interval or the time to elapse.
+        :param samples: (list) Optional pre-collected (elapsed_time, bytes_sent, bytes_received) samples.
+
+        :return : (int) The elapsed time, (int) The total bytes sent, (int) the total bytes received.
+
+        """
+        if samples:
+            return samples.pop(0)
+        return self.calcBandwidthInterval(pid, interval)
+
+    def getBandwidthById(self, pid, interval=10, elapsed=True, args=None, print_output=True, samples=None):
         """
 
         This method gets the bandwidth for a single pid and optionally prints it or just returns is.
@@ -214,9 +450,11 @@ class NetWorkHelper:
             -megabyte or -m: to show the results in megabyte/s.
             -gigabyte or -g to show the results in gigabyte/s.
         :param print_output: (bool) True if you want to print the output, false if not.
+        :param samples: (list) Optional (elapsed_time, bytes_sent, bytes_received) samples that were already collected,
+            one for elapsed or one per second otherwise. They are used instead of sampling the counters again.
 
-        :return : (int) The pid , (int) The total bytes sent in a second, (int) the
-        total bytes received in a second.
+        :return : (BandwidthResult) The raw bytes sent and received and the elapsed time. It unpacks to the pid, the
+        total sent and the total received in the unit of args, and str() gives the printed message.
 
 
         """
@@ -224,176 +462,38 @@ class NetWorkHelper:
             args = ["-byte"]
         if not isinstance(args, list):
             raise TypeError("args must be a list")
-        returnMessage = ""
-        totalMessage = ""
-        if elapsed:
-            if "-byte" in args or "-b" in args:
-                elapsed_time, total_bytes_sent, total_bytes_received = self.calcBandwidthInterval(pid, interval)
-                bytes_per_second_sent = total_bytes_sent / elapsed_time
-                bytes_per_second_received = total_bytes_received / elapsed_time
-
-                total_bytes_sent = (
-                    f'{total_bytes_sent:.3f}' if f'{total_bytes_sent:.3f}' != '0.000' else total_bytes_sent)
-                total_bytes_received = (
-                    f'{total_bytes_received:.3f}' if f'{total_bytes_received:.3f}' != '0.000' else total_bytes_received)
-                bytes_per_second_sent = (
-                    f'{bytes_per_second_sent:.3f}' if f'{bytes_per_second_sent:.3f}' != '0.000' else bytes_per_second_sent)
-                bytes_per_second_received = (
-                    f'{bytes_per_second_received:.3f}' if f'{bytes_per_second_received:.3f}' != '0.000' else bytes_per_second_received)
-
-                if print_output:
-                    print(
-                        f"Process {pid} sent {bytes_per_second_sent} bytes/s and received {bytes_per_second_received} bytes/s. With a Total of {total_bytes_sent} bytes sent, and "
-                        f" {total_bytes_received} bytes received, over approximately {interval} seconds.")
-                return pid, total_bytes_sent, total_bytes_received
-            elif "-kilobyte" in args or "-k" in args:
-                elapsed_time, total_bytes_sent, total_bytes_received = self.calcBandwidthInterval(pid, interval)
-                kilobytes_sent = total_bytes_sent / 1024
-                kilobytes_received = total_bytes_received / 1024
-                kilobytes_per_second_sent = kilobytes_sent / elapsed_time
-                kilobytes_per_second_received = kilobytes_received / elapsed_time
-
-                kilobytes_sent = (
-                    f'{kilobytes_sent:.3f}' if f'{kilobytes_sent:.3f}' != '0.000' else kilobytes_sent)
-                kilobytes_received = (
-                    f'{kilobytes_received:.3f}' if f'{kilobytes_received:.3f}' != '0.000' else kilobytes_received)
-                kilobytes_per_second_sent = (
-                    f'{kilobytes_per_second_sent:.3f}' if f'{kilobytes_per_second_sent:.3f}' != '0.000' else kilobytes_per_second_sent)
-                kilobytes_per_second_received = (
-                    f'{kilobytes_per_second_received:.3f}' if f'{kilobytes_per_second_received:.3f}' != '0.000' else kilobytes_per_second_received)
-
-                if print_output:
-                    print(
-                        f"Process {pid} sent {kilobytes_per_second_sent} KB/s and received {kilobytes_per_second_received} KB/s. With a Total of {kilobytes_sent} KB sent, and "
-                        f" {kilobytes_received} KB received, over approximately {interval} seconds.")
-                return pid, kilobytes_sent, kilobytes_received
-
-            elif "-megabyte" in args or "-m" in args:
-                elapsed_time, total_bytes_sent, total_bytes_received = self.calcBandwidthInterval(pid, interval)
-                megabytes_sent = total_bytes_sent / (1024 * 1024)
-                megabytes_received = total_bytes_received / (1024 * 1024)
-                megabytes_per_second_sent = megabytes_sent / elapsed_time
-                megabytes_per_second_received = megabytes_received / elapsed_time
-
-                megabytes_sent = (
-                    f'{megabytes_sent:.3f}' if f'{megabytes_sent:.3f}' != '0.000' else megabytes_sent)
-                megabytes_received = (
-                    f'{megabytes_received:.3f}' if f'{megabytes_received:.3f}' != '0.000' else megabytes_received)
-                megabytes_per_second_sent = (
-                    f'{megabytes_per_second_sent:.3f}' if f'{megabytes_per_second_sent:.3f}' != '0.000' else megabytes_per_second_sent)
-                megabytes_per_second_received = (
-                    f'{megabytes_per_second_received:.3f}' if f'{megabytes_per_second_received:.3f}' != '0.000' else megabytes_per_second_received)
-
-                if print_output:
-                    print(
-                        f"Process {pid} sent {megabytes_per_second_sent} MB/s and received {megabytes_per_second_received} MB/s. With a Total of {megabytes_sent} MB sent, and"
-                        f" {megabytes_received} MB received, over approximately {interval} seconds.")
-                return pid, megabytes_sent, megabytes_received
-
-            elif "-gigabyte" in args or "-g" in args:
-                elapsed_time, total_bytes_sent, total_bytes_received = self.calcBandwidthInterval(pid, interval)
-                gigabytes_sent = total_bytes_sent / (1024 * 1024 * 1024)
-                gigabytes_received = total_bytes_received / (1024 * 1024 * 1024)
-                gigabytes_per_second_sent = gigabytes_sent / elapsed_time
-                gigabytes_per_second_received = gigabytes_received / elapsed_time
-
-                gigabytes_sent = (
-                    f'{gigabytes_sent:.3f}' if f'{gigabytes_sent:.3f}' != '0.000' else gigabytes_sent)
-                gigabytes_received = (
-                    f'{gigabytes_received:.3f}' if f'{gigabytes_received:.3f}' != '0.000' else gigabytes_received)
-                gigabytes_per_second_sent = (
-                    f'{gigabytes_per_second_sent:.3f}' if f'{gigabytes_per_second_sent:.3f}' != '0.000' else gigabytes_per_second_sent)
-                gigabytes_per_second_received = (
-                    f'{gigabytes_per_second_received:.3f}' if f'{gigabytes_per_second_received:.3f}' != '0.000' else gigabytes_per_second_received)
-
-                if print_output:
-                    print(
-                        f"Process {pid} sent {gigabytes_per_second_sent} GB/s and received {gigabytes_per_second_received} GB/s. With a Total of {gigabytes_sent} GB sent, and "
-                        f" {gigabytes_received} GB received, over approximately {interval} seconds.")
-                return pid, gigabytes_sent, gigabytes_received
-
-            else:
-                print(
-                    "Invalid argument. Please use one of the following: -byte/-b, -kilobyte/-k, -megabyte/-m, "
-                    "-gigabyte/-g.")
-
-        elif not elapsed:
-            total_bytes_sent, total_bytes_received = 0, 0
-            for i in range(interval):
-                elapsed_time,bytes_sent, bytes_received = self.calcBandwidthInterval(pid,1)
-                total_bytes_sent += bytes_sent
-                total_bytes_received += bytes_received
-                elapsed_time = i + 1
-                bytes_per_second_sent = total_bytes_sent / elapsed_time
-                bytes_per_second_received = total_bytes_received / elapsed_time
-                if "-byte" in args or "-b" in args:
-                    bytes_per_second_sent = (
-                        f'{bytes_per_second_sent:.3f}' if f'{bytes_per_second_sent:.3f}' != '0.000' else bytes_per_second_sent)
-                    bytes_per_second_received = (
-                        f'{bytes_per_second_received:.3f}' if f'{bytes_per_second_received:.3f}' != '0.000' else bytes_per_second_received)
-
-                    if print_output:
-                        print(
-                            f"Process {pid} sent {bytes_per_second_sent} bytes/s and received {bytes_per_second_received} bytes/s. {elapsed_time} seconds elapsed.")
-                    returnMessage = returnMessage + f"Process {pid} sent {bytes_per_second_sent} bytes/s and received {bytes_per_second_received} bytes/s. {elapsed_time} seconds elapsed.\n"
-                    totalMessage = f"With a Total of {total_bytes_sent} Bytes sent, and  {total_bytes_received} Bytes received, over approximately {interval} seconds. "
-                elif "-kilobyte" in args or "-k" in args:
-                    kilobytes_sent = total_bytes_sent / 1024
-                    kilobytes_received = total_bytes_received / 1024
-                    kilobytes_per_second_sent = kilobytes_sent / elapsed_time
-                    kilobytes_per_second_received = kilobytes_received / elapsed_time
-
-                    kilobytes_per_second_sent = (
-                        f'{kilobytes_per_second_sent:.3f}' if f'{kilobytes_per_second_sent:.3f}' != '0.000' else kilobytes_per_second_sent)
-                    kilobytes_per_second_received = (
-                        f'{kilobytes_per_second_received:.3f}' if f'{kilobytes_per_second_received:.3f}' != '0.000' else kilobytes_per_second_received)
-
-                    print(
-                        f"Process {pid} sent {kilobytes_per_second_sent} KB/s and received {kilobytes_per_second_received} KB/s. {elapsed_time} seconds elapsed.")
-                    returnMessage = returnMessage + f"Process {pid} sent {kilobytes_per_second_sent} KB/s and received {kilobytes_per_second_received} KB/s. {elapsed_time} seconds elapsed.\n"
-
-                elif "-megabyte" in args or "-m" in args:
-                    megabytes_sent = total_bytes_sent / (1024 * 1024)
-                    megabytes_received = total_bytes_received / (1024 * 1024)
-                    megabytes_per_second_sent = megabytes_sent / elapsed_time
-                    megabytes_per_second_received = megabytes_received / elapsed_time
-
-                    megabytes_per_second_sent = (
-                        f'{megabytes_per_second_sent:.3f}' if f'{megabytes_per_second_sent:.3f}' != '0.000' else megabytes_per_second_sent)
-                    megabytes_per_second_received = (
-                        f'{megabytes_per_second_received:.3f}' if f'{megabytes_per_second_received:.3f}' != '0.000' else megabytes_per_second_received)
-
-                    print(
-                        f"Process {pid} sent {megabytes_per_second_sent} MB/s and received {megabytes_per_second_received} MB/s. {elapsed_time} seconds elapsed.")
-                    returnMessage = returnMessage + f"Process {pid} sent {megabytes_per_second_sent} MB/s and received {megabytes_per_second_received} MB/s. {elapsed_time} seconds elapsed.\n"
-
-                elif "-gigabyte" in args or "-g" in args:
-                    gigabytes_sent = total_bytes_sent / (1024 * 1024 * 1024)
-                    gigabytes_received = total_bytes_received / (1024 * 1024 * 1024)
-                    gigabytes_per_second_sent = gigabytes_sent / elapsed_time
-                    gigabytes_per_second_received = gigabytes_received / elapsed_time
-
-                    gigabytes_per_second_sent = (
-                        f'{gigabytes_per_second_sent:.3f}' if f'{gigabytes_per_second_sent:.3f}' != '0.000' else gigabytes_per_second_sent)
-                    gigabytes_per_second_received = (
-                        f'{gigabytes_per_second_received:.3f}' if f'{gigabytes_per_second_received:.3f}' != '0.000' else gigabytes_per_second_received)
-
-                    print(
-                        f"Process {pid} sent {gigabytes_per_second_sent} GB/s and received {gigabytes_per_second_received} GB/s. {elapsed_time} seconds elapsed.")
-                    returnMessage = returnMessage + f"Process {pid} sent {gigabytes_per_second_sent} GB/s and received {gigabytes_per_second_received} GB/s. {elapsed_time} seconds elapsed.\n"
-
-                else:
-                    print(
-                        "Invalid argument. Please use one of the following: -byte/-b, -kilobyte/-k, -megabyte/-m, "
-                        "-gigabyte/-g.")
-            return returnMessage + "\n" + totalMessage
+        unit = unitFromArgs(args)
+        if unit is None:
+            self.instrumentation.error("getBandwidthById", ValueError(f"Invalid unit arguments {args}"))
+            print(
+                "Invalid argument. Please use one of the following: -byte/-b, -kilobyte/-k, -megabyte/-m, "
+                "-gigabyte/-g.")
+            return None
 
+        if elapsed:
+            elapsed_time, total_bytes_sent, total_bytes_received = self.takeSample(pid, interval, samples)
+            result = BandwidthResult(pid, total_bytes_sent, total_bytes_received, elapsed_time, interval, unit)
+            if print_output:
+                print(result.format())
+            return result
+
+        ticks = []
+        total_bytes_sent = total_bytes_received = 0
+        for seconds in range(1, interval + 1):
+            tick = self.takeSample(pid, 1, samples)
+            ticks.append(tick)
+            total_bytes_sent += tick[1]
+            total_bytes_received += tick[2]
+            if print_output:
+                print(BandwidthResult.formatTick(pid, seconds, total_bytes_sent, total_bytes_received, unit))
+        return BandwidthResult.fromTicks(pid, ticks, interval, unit)
 
     def getAllBandwidth(self, pids=None, interval=10, elapsed=True, args=None, print_output=True, threading=True,
-                        max_workers=100):
+                        max_workers=100, batched=True, recorder=None):
         """
 
-        This method gets the bandwidth for a list of pids using multi-threading.
+        This method gets the bandwidth for a list of pids, either on one shared sampling clock or using
+        multi-threading.
 
 
         :param pid: (int) The process id to calculate it's bandwidth.
@@ -407,32 +507,244 @@ class NetWorkHelper:
         :param print_output: (bool) True if you want to print the output, false if not.
         :param threading: (bool) True if you want to use multi-threading, false if not.
         :param max_workers: (int) The maximum number of threads that can be used to execute the given calls.
+        :param batched: (bool) True if you want all the pids sampled together in about one interval, false to sample
+            every pid on it's own.
+        :param recorder: (SampleRecorder) Optional recorder the results are appended to.
 
-        :return : (list) The pid, total_bytes_sent, total_bytes_received for each PID passed.
+        :return : (list) A BandwidthResult for each PID passed, Results.convertResults() turns them into numbers in
+        one unit.
 
 
         """
         if pids is None or pids == []:
-            pids = self.getProcesses(args=["-pid"])
+            pids = self.getDefaultPids()
         if args is None:
             args = ["-byte"]
         bandwidthList = []
-        if threading:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_id = {executor.submit(self.getBandwidthById, pid, interval, elapsed, args, print_output): pid
-                                for
-                                pid in
-                                pids}
-                for future in concurrent.futures.as_completed(future_to_id):
-                    pid = future_to_id[future]
-                    try:
-                        bandwidth = future.result()
-                        # process the bandwidth information
-                        bandwidthList.append(bandwidth)
-                    except Exception as e:
-                        print(f"Error fetching bandwidth for PID {pid}: {e}")
+        if batched:
+            ticks = 1 if elapsed else interval
+            samples = self.calcBandwidthBatch(pids, interval, ticks)
+            with self.instrumentation.stage("formatSamples"):
+                bandwidthList = self.formatSamples(pids, samples, ticks, interval, elapsed, args, print_output)
+        elif threading:
+            with self.instrumentation.stage("getAllBandwidth.threads"):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    future_to_id = {
+                        executor.submit(self.getBandwidthById, pid, interval, elapsed, args, print_output): pid
+                        for
+                        pid in
+                        pids}
+                    for future in concurrent.futures.as_completed(future_to_id):
+                        pid = future_to_id[future]
+                        try:
+                            bandwidth = future.result()
+                            # process the bandwidth information
+                            bandwidthList.append(bandwidth)
+                        except Exception as e:
+                            self.instrumentation.error("getAllBandwidth", e)
+                            print(f"Error fetching bandwidth for PID {pid}: {e}")
         else:
             for pid in pids:
                 bandwidthList.append(self.getBandwidthById(pid, interval, elapsed, args, print_output))
 
+        if recorder is not None:
+            recorder.appendResults(bandwidthList)
+            recorder.flush()
         return bandwidthList
+
+    def getDefaultPids(self):
+        """
+
+        This method lists every process that has a socket, once per process.
+
+        :return : (list) The process ids.
+
+        """
+        if ProcNetReader.isSupported():
+            return list(self.iterConnections().pids())
+        return list(dict.fromkeys(self.getProcesses(args=["-pid"])))
+
+    def formatSamples(self, pids, samples, ticks, interval, elapsed, args, print_output):
+        """
+
+        This method turns pre-collected samples into the results of getBandwidthById, without sampling again.
+
+        :param pids: (list) The process ids, in the order the results should be in.
+        :param samples: (dict) The samples of calcBandwidthBatch.
+        :param ticks: (int) The number of samples every pid should have.
+
+        :return : (list) The result of getBandwidthById for every pid that was sampled fully.
+
+        """
+        bandwidthList = []
+        for pid in pids:
+            pidSamples = samples.get(int(pid), [])
+            if len(pidSamples) != ticks:
+                # The process went away while it was being sampled.
+                self.instrumentation.count("processes_exited")
+                print(f"Error fetching bandwidth for PID {pid}: the process exited during the interval.")
+                continue
+            try:
+                bandwidthList.append(self.getBandwidthById(pid, interval, elapsed, args, print_output,
+                                                           list(pidSamples)))
+            except Exception as e:
+                self.instrumentation.error("formatSamples", e)
+                print(f"Error fetching bandwidth for PID {pid}: {e}")
+        return bandwidthList
+
+    @staticmethod
+    def rankingValue(key, bytes_sent, bytes_received):
+        """
+
+        This method picks the value the processes are ranked by.
+
+        :param key: (str) One of sent, received or total.
+
+        :return : (int) The bytes to rank by.
+
+        """
+        if key == "sent":
+            return bytes_sent
+        if key == "received":
+            return bytes_received
+        if key == "total":
+            return bytes_sent + bytes_received
+        raise ValueError("Invalid key. Please use one of the following: sent, received, total.")
+
+    def getTopBandwidth(self, n=20, pids=None, interval=10, key="total"):
+        """
+
+        This method gets the n processes that used the most bandwidth over one interval, highest first.
+
+        :param n: (int) The number of processes to return.
+        :param pids: (list) The process ids to rank, defaults to every process with a socket.
+        :param interval: (int) The interval or the time to elapse.
+        :param key: (str) Rank by the bytes sent, received or the total of both.
+
+        :return : (list) (pid, bytes_sent, bytes_received) tuples of the top n processes.
+
+        """
+        self.rankingValue(key, 0, 0)
+        if pids is None or pids == []:
+            pids = self.iterConnections().pids()
+        samples = self.calcBandwidthBatch(pids, interval)
+        # nlargest keeps a heap of n entries, so memory does not grow with the number of pids.
+        top = heapq.nlargest(n, ((pid, sample[0][1], sample[0][2]) for pid, sample in samples.items() if sample),
+                             key=lambda item: self.rankingValue(key, item[1], item[2]))
+        return top
+
+    def iterTopBandwidth(self, n=20, pids=None, interval=1, key="total", capacity=None, rounds=None):
+        """
+
+        This method keeps sampling and yields the running top n processes after every interval. The ranking is kept in
+        a Space-Saving sketch, so memory stays bounded even when thousands of short-lived processes come and go.
+
+        :param n: (int) The number of processes to yield.
+        :param pids: (list) The process ids to rank, defaults to the processes with a socket in each round.
+        :param interval: (int) The interval or the time to elapse between rankings.
+        :param key: (str) Rank by the bytes sent, received or the total of both.
+        :param capacity: (int) The number of counters in the sketch, defaults to 10 times n.
+        :param rounds: (int) The number of rankings to yield, defaults to forever.
+
+        :return : (generator) Lists of (pid, bytes, error) tuples, the bytes overestimate by at most error.
+
+        """
+        self.rankingValue(key, 0, 0)
+        sketch = SpaceSavingSketch(capacity or 10 * n)
+        done = 0
+        while rounds is None or done < rounds:
+            roundPids = pids if pids else self.iterConnections().pids()
+            samples = self.calcBandwidthBatch(roundPids, interval)
+            for pid, sample in samples.items():
+                if sample:
+                    sketch.update(pid, self.rankingValue(key, sample[0][1], sample[0][2]))
+            done += 1
+            yield sketch.top(n)
+
+    def startMonitor(self, pids=None, interval=1, history=3600, recorder=None):
+        """
+
+        This method starts a background monitor that keeps sampling and stores the history of every process and
+        interface, so rates can be read at any time without waiting for an interval.
+
+        :param pids: (list) The process ids to follow, defaults to every process with a socket.
+        :param interval: (int) The time between two samples in seconds.
+        :param history: (int) The number of samples kept per process and interface.
+        :param recorder: (SampleRecorder) Optional recorder every sample is also written to, see Recording.py.
+
+        :return : (BandwidthMonitor) The running monitor, call stop() on it when done.
+
+        """
+        return BandwidthMonitor(self, pids, interval, history, recorder=recorder).start()
+
+    def startAdaptiveMonitor(self, pids=None, min_interval=1, max_interval=30, cpu_budget=0.05, history=3600,
+                             recorder=None):
+        """
+
+        This method starts a background monitor that samples busy processes and interfaces every min_interval and
+        idle ones less and less often, up to every max_interval, while using at most cpu_budget seconds of CPU per
+        second.
+
+        :param pids: (list) The process ids to follow, defaults to every process with a socket.
+        :param min_interval: (int) The interval of a busy process or interface, in seconds.
+        :param max_interval: (int) The longest interval of an idle process or interface, in seconds.
+        :param cpu_budget: (float) The CPU seconds the monitor may use per second, or None for no limit.
+        :param history: (int) The number of samples kept per process and interface.
+        :param recorder: (SampleRecorder) Optional recorder every sample is also written to, see Recording.py.
+
+        :return : (AdaptiveScheduler) The running monitor, call stop() on it when done.
+
+        """
+        return AdaptiveScheduler(self, pids, min_interval, max_interval, cpu_budget, history,
+                                 recorder=recorder).start()
+
+    def getNamespaceBandwidth(self, pids=None, interval=10, include_loopback=False):
+        """
+
+        This method gets the bandwidth of every network namespace the pids are in, such as the ones of containers,
+        per interface and in total. Each namespace is read once per snapshot however many of the pids it holds.
+
+        :param pids: (list) The process ids whose namespaces should be measured, defaults to every process.
+        :param interval: (int) The interval or the time to elapse.
+        :param include_loopback: (bool) True to count the loopback interface, false if not.
+
+        :return : (dict) The namespace inodes as keys, and dicts with the pids, the elapsed_time, the
+        (bytes_sent, bytes_received) of every interface and the total as values.
+
+        """
+        if pids is None or pids == []:
+            pids = ProcNetReader().listPids()
+        return NamespaceSampler(include_loopback=include_loopback).sample(pids, interval)
+
+    @staticmethod
+    def enableInstrumentation(enabled=True, hook=None):
+        """
+
+        This method turns the timers and counters of the hot paths on or off. While they are off they cost about one
+        attribute check per call.
+
+        :param enabled: (bool) True to turn them on, false to turn them off.
+        :param hook: (callable) Optional hook that is called with (event, name, value) for every measurement, where
+            event is stage, count or error.
+
+        :return : (Instrumentation) The instrumentation, for adding or removing more hooks.
+
+        """
+        NetWorkHelper.instrumentation.enable(enabled)
+        if hook is not None:
+            NetWorkHelper.instrumentation.addHook(hook)
+        return NetWorkHelper.instrumentation
+
+    @staticmethod
+    def getStats():
+        """
+
+        This method returns what the instrumentation measured so far.
+
+        :return : (dict) The stages with their calls, total, mean and max seconds, the counters such as rows_parsed,
+        pids_resolved and pids_sampled, the errors per stage, and the hits and misses of the name cache.
+
+        """
+        stats = NetWorkHelper.instrumentation.stats()
+        stats["nameCache"] = NetWorkHelper.nameCache.stats()
+        return stats
@@ -0,0 +1,608 @@
+"""
+
+
+This module reads the Linux socket tables straight from /proc/net so the NetWorkHelper class does not have to fork
+the netstat command. It decodes the hex encoded addresses, ports, states and inodes into Connection records and maps
+each socket inode back to the PID that owns it.
+
+"""
+
+import ipaddress
+import os
+import socket
+import sys
+from collections import namedtuple
+
+"""
+
+A Connection is a single row of a /proc/net socket table. pid is None when the owning process could not be found
+(the socket belongs to another user or the process exited while we were reading).
+
+"""
+
+Connection = namedtuple("Connection", ["proto", "local_address", "local_port", "remote_address", "remote_port",
+                                       "state", "inode", "uid", "pid"])
+
+# The socket tables we know how to read, mapped to their address family.
+PROC_NET_TABLES = {
+    "tcp": socket.AF_INET,
+    "tcp6": socket.AF_INET6,
+    "udp": socket.AF_INET,
+    "udp6": socket.AF_INET6,
+}
+
+# The kernel state codes from include/net/tcp_states.h.
+TCP_STATES = {
+    "01": "ESTABLISHED",
+    "02": "SYN_SENT",
+    "03": "SYN_RECV",
+    "04": "FIN_WAIT1",
+    "05": "FIN_WAIT2",
+    "06": "TIME_WAIT",
+    "07": "CLOSE",
+    "08": "CLOSE_WAIT",
+    "09": "LAST_ACK",
+    "0A": "LISTEN",
+    "0B": "CLOSING",
+    "0C": "NEW_SYN_RECV",
+}
+
+
+class ConnectionStream:
+    """
+
+    The ConnectionStream class wraps an iterable of records and lets filter and map stages be chained on it lazily.
+    Nothing is read until the stream is iterated, and like any generator it can only be iterated once.
+
+    """
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def filter(self, predicate):
+        """
+
+        This method adds a stage that only lets through the records the predicate accepts.
+
+        :param predicate: (callable) Takes a record and returns True to keep it.
+
+        :return : (ConnectionStream) The filtered stream.
+
+        """
+        return ConnectionStream(record for record in self.iterable if predicate(record))
+
+    def map(self, function):
+        """
+
+        This method adds a stage that replaces every record with the result of the function.
+
+        :param function: (callable) Takes a record and returns the new value.
+
+        :return : (ConnectionStream) The mapped stream.
+
+        """
+        return ConnectionStream(function(record) for record in self.iterable)
+
+    def pids(self):
+        """
+
+        This method yields the pid of every Connection record the first time it is seen, skipping unknown pids.
+
+        :return : (generator) The unique process ids.
+
+        """
+        seen = set()
+        for conn in self.iterable:
+            if conn.pid is not None and conn.pid not in seen:
+                seen.add(conn.pid)
+                yield conn.pid
+
+
+class ProcNetReader:
+    """
+
+    The ProcNetReader class reads the /proc/net socket tables in bulk and turns them into Connection records.
+
+    """
+
+    def __init__(self, proc_root="/proc", instrumentation=None):
+        """
+
+        :param proc_root: (str) The mount point of the proc filesystem.
+        :param instrumentation: (Instrumentation) Optional instrumentation the number of rows parsed is added to.
+
+        """
+        self.proc_root = proc_root
+        self.instrumentation = instrumentation
+
+    @staticmethod
+    def isSupported(proc_root="/proc"):
+        """
+
+        This method checks if the /proc/net socket tables can be read on this system.
+
+        :param proc_root: (str) The mount point of the proc filesystem.
+
+        :return : (bool) True if /proc/net/tcp exists, false if not.
+
+        """
+        return os.path.exists(os.path.join(proc_root, "net", "tcp"))
+
+    @staticmethod
+    def decodeAddress(hexAddress, family):
+        """
+
+        This method decodes an address the way the kernel prints it in /proc/net, as hex words in host byte order.
+
+        :param hexAddress: (str) The hex address part, without the port.
+        :param family: (int) socket.AF_INET or socket.AF_INET6.
+
+        :return : (str) The address in its normal printable form.
+
+        """
+        raw = bytes.fromhex(hexAddress)
+        if sys.byteorder == "little":
+            # Every 32-bit word is printed in host order, so flip each one back to network order.
+            raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+        return socket.inet_ntop(family, raw)
+
+    def iterTable(self, proto, inodeIndex=None, pid_root=None, connFilter=None):
+        """
+
+        This method reads one socket table line by line and yields its rows as Connection records, so the whole table
+        never has to be held in memory.
+
+        :param proto: (str) One of tcp, tcp6, udp or udp6.
+        :param inodeIndex: (dict) An optional inode to PID index used to fill the pid field.
+        :param pid_root: (str) An optional /proc/<pid> directory to read the table from, instead of the host's one.
+        :param connFilter: (ConnectionFilter) Optional filter checked while the line is parsed, cheapest fields first.
+
+        :return : (generator) The Connection records of the table.
+
+        """
+        if proto not in PROC_NET_TABLES:
+            raise ValueError(f"Unknown socket table {proto}, use one of: {', '.join(PROC_NET_TABLES)}.")
+        # UDP sockets have no connection state, the kernel only reuses the TCP codes for them.
+        isTcp = proto.startswith("tcp")
+        stateCodes = connFilter.stateCodes if connFilter is not None else None
+        if stateCodes is not None and not isTcp:
+            return
+        family = PROC_NET_TABLES[proto]
+        path = os.path.join(pid_root or self.proc_root, "net", proto)
+        try:
+            table = open(path, "r", encoding="ascii", buffering=1 << 16)
+        except OSError:
+            return
+
+        if inodeIndex is None:
+            inodeIndex = {}
+        decode = self.decodeAddress
+        label = proto.upper()
+        rows = 0
+        try:
+            with table:
+                # The first line is the column header.
+                next(table, None)
+                for line in table:
+                    rows += 1
+                    words = line.split()
+                    if len(words) < 10:
+                        continue
+                    if stateCodes is not None and words[3] not in stateCodes:
+                        continue
+                    localHex, localPort = words[1].split(":")
+                    remoteHex, remotePort = words[2].split(":")
+                    localPort, remotePort = int(localPort, 16), int(remotePort, 16)
+                    if connFilter is not None and not connFilter.matchesPorts(localPort, remotePort):
+                        continue
+                    localAddress, remoteAddress = decode(localHex, family), decode(remoteHex, family)
+                    if connFilter is not None and not connFilter.matchesAddresses(localAddress, remoteAddress):
+                        continue
+                    inode = int(words[9])
+                    yield Connection(label, localAddress, localPort, remoteAddress, remotePort,
+                                     TCP_STATES.get(words[3], words[3]) if isTcp else "", inode, int(words[7]),
+                                     inodeIndex.get(inode))
+        finally:
+            # Counted once per table, even when the stream is not read to the end.
+            if self.instrumentation is not None:
+                self.instrumentation.count("rows_parsed", rows)
+
+    def readTable(self, proto, inodeIndex=None, pid_root=None):
+        """
+
+        This method reads one socket table and returns its rows as Connection records.
+
+        :param proto: (str) One of tcp, tcp6, udp or udp6.
+        :param inodeIndex: (dict) An optional inode to PID index used to fill the pid field.
+        :param pid_root: (str) An optional /proc/<pid> directory to read the table from, instead of the host's one.
+
+        :return : (list) The Connection records of the table.
+
+        """
+        return list(self.iterTable(proto, inodeIndex, pid_root))
+
+    def listPids(self):
+        """
+
+        This method lists the ids of all the processes in the proc filesystem.
+
+        :return : (list) The process ids.
+
+        """
+        try:
+            return [int(name) for name in os.listdir(self.proc_root) if name.isdigit()]
+        except OSError:
+            return []
+
+    def pidExists(self, pid):
+        """
+
+        This method checks if a process is still running.
+
+        :param pid: (int) The process id to check.
+
+        :return : (bool) True if the process exists, false if not.
+
+        """
+        return os.path.isdir(os.path.join(self.proc_root, str(pid)))
+
+    def buildInodeIndex(self, pids=None, inodes=None):
+        """
+
+        This method walks /proc/<pid>/fd for every process and maps each socket inode to the PID that holds it.
+
+        :param pids: (list) Optional process ids to limit the walk to, defaults to every process.
+        :param inodes: (set) Optional socket inodes to look for. The walk stops as soon as all of them are found.
+
+        :return : (dict) The socket inodes as keys and the owning PIDs as values.
+
+        """
+        inodeIndex = {}
+        if inodes is not None:
+            # Inode 0 belongs to sockets in TIME_WAIT, which no process holds anymore.
+            inodes = set(inodes) - {0}
+            if not inodes:
+                return inodeIndex
+        if pids is None:
+            pids = self.listPids()
+        for pid in pids:
+            pid = int(pid)
+            fdDir = os.path.join(self.proc_root, str(pid), "fd")
+            try:
+                fds = os.listdir(fdDir)
+            except OSError:
+                # The process exited or we are not allowed to look at it.
+                continue
+            for fd in fds:
+                try:
+                    link = os.readlink(os.path.join(fdDir, fd))
+                except OSError:
+                    continue
+                if link.startswith("socket:["):
+                    inode = int(link[8:-1])
+                    if inodes is None:
+                        inodeIndex.setdefault(inode, pid)
+                    elif inode in inodes:
+                        inodeIndex[inode] = pid
+                        inodes.discard(inode)
+                        if not inodes:
+                            return inodeIndex
+        return inodeIndex
+
+    def iterConnections(self, protocols=None, resolve_pids=True, connFilter=None):
+        """
+
+        This method streams the rows of every requested socket table, one Connection record at a time.
+
+        :param protocols: (list) The tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param resolve_pids: (bool) True if you want the pid field filled in, false if not.
+        :param connFilter: (ConnectionFilter) Optional filter applied while parsing. With a filter, only the inodes of
+            the matching rows are looked up, after the tables are read.
+
+        :return : (ConnectionStream) A one-shot stream of Connection records. The rows are parsed one at a time, but
+        with resolve_pids and no filter the whole inode index is built before the first row, which takes memory in
+        proportion to the sockets held by processes. Pass resolve_pids=False for a stream that stays flat.
+
+        """
+        if protocols is None:
+            protocols = list(PROC_NET_TABLES)
+        if connFilter is not None and connFilter.protocols is not None:
+            protocols = [proto for proto in protocols if proto in connFilter.protocols]
+        if connFilter is not None and resolve_pids:
+            return ConnectionStream(self.iterMatched(protocols, connFilter))
+        return ConnectionStream(self.iterAll(protocols, resolve_pids, connFilter))
+
+    def iterAll(self, protocols, resolve_pids, connFilter=None):
+        """
+
+        This method reads the rows of the tables, with the inode index built when the first row is asked for. A row
+        only gets its pid once every process has been walked, so with resolve_pids the index of all the socket inodes
+        is held for the whole stream.
+
+        :param protocols: (list) The tables to read.
+        :param resolve_pids: (bool) True if you want the pid field filled in, false if not.
+        :param connFilter: (ConnectionFilter) Optional filter applied while parsing.
+
+        :return : (generator) The Connection records.
+
+        """
+        inodeIndex = self.buildInodeIndex() if resolve_pids else None
+        for proto in protocols:
+            yield from self.iterTable(proto, inodeIndex, connFilter=connFilter)
+
+    def iterMatched(self, protocols, connFilter):
+        """
+
+        This method reads the rows that match a filter first, and then resolves the pids of just those rows.
+
+        :param protocols: (list) The tables to read.
+        :param connFilter: (ConnectionFilter) The filter the rows have to match.
+
+        :return : (generator) The matching Connection records with their pid filled in.
+
+        """
+        matched = [conn for proto in protocols for conn in self.iterTable(proto, connFilter=connFilter)]
+        if not matched:
+            return
+        inodeIndex = self.buildInodeIndex(inodes={conn.inode for conn in matched})
+        for conn in matched:
+            yield conn._replace(pid=inodeIndex.get(conn.inode))
+
+    def getConnections(self, protocols=None, resolve_pids=True, connFilter=None):
+        """
+
+        This method reads every requested socket table and returns all of their rows.
+
+        :param protocols: (list) The tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param resolve_pids: (bool) True if you want the pid field filled in, false if not.
+        :param connFilter: (ConnectionFilter) Optional filter the rows have to match.
+
+        :return : (list) The Connection records of all the tables.
+
+        """
+        return list(self.iterConnections(protocols, resolve_pids, connFilter))
+
+    @staticmethod
+    def formatConnections(connections):
+        """
+
+        This method renders Connection records the way netstat -no lays them out, one connection per line.
+
+        :param connections: (list) The Connection records to render.
+
+        :return : (str) The rendered table.
+
+        """
+        lines = [f"{'Proto':<6} {'Local Address':<46} {'Foreign Address':<46} {'State':<12} PID"]
+        for conn in connections:
+            local = f"{conn.local_address}:{conn.local_port}"
+            remote = f"{conn.remote_address}:{conn.remote_port}"
+            pid = conn.pid if conn.pid is not None else "-"
+            lines.append(f"{conn.proto:<6} {local:<46} {remote:<46} {conn.state:<12} {pid}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def parseNetstatLine(line):
+        """
+
+        This method parses one connection line of netstat -no style output back into a Connection record.
+
+        :param line: (str) The line to parse.
+
+        :return : (Connection) The parsed record, or None if the line is not a connection.
+
+        """
+        words = line.split()
+        if len(words) < 4 or not (words[0].startswith("TCP") or words[0].startswith("UDP")):
+            return None
+        local_address, local_port = ProcNetReader.splitEndpoint(words[1])
+        remote_address, remote_port = ProcNetReader.splitEndpoint(words[2])
+        state = words[3] if len(words) > 4 else ""
+        pid = int(words[-1]) if words[-1].isdigit() else None
+        return Connection(words[0], local_address, local_port, remote_address, remote_port, state, 0, 0, pid)
+
+    @staticmethod
+    def splitEndpoint(endpoint):
+        """
+
+        This method splits an address:port pair as netstat prints it.
+
+        :param endpoint: (str) The endpoint, such as 127.0.0.1:80 or [::1]:80.
+
+        :return : (str) The address, (int) the port or 0 when it is a wildcard.
+
+        """
+        address, _, port = endpoint.rpartition(":")
+        return address.strip("[]"), int(port) if port.isdigit() else 0
+
+
+class ConnectionFilter:
+    """
+
+    The ConnectionFilter class describes which connections a query is interested in. Every criterion is optional and
+    all the given ones have to match. The socket tables check the state, the ports and the addresses while they parse
+    each line, so rows that do not match never get their pid or name looked up.
+
+    """
+
+    def __init__(self, protocols=None, local_ports=None, remote_ports=None, local_cidr=None, remote_cidr=None,
+                 states=None, names=None):
+        """
+
+        :param protocols: (list) The socket tables to keep, such as ["tcp", "tcp6"].
+        :param local_ports: The local ports to keep, as a port, a (first, last) tuple, a range or a list of those.
+        :param remote_ports: The remote ports to keep, in the same forms as local_ports.
+        :param local_cidr: (str) A network such as 10.0.0.0/8 the local address has to be in, or a list of them.
+        :param remote_cidr: (str) A network the remote address has to be in, or a list of them.
+        :param states: (list) The TCP states to keep, such as ["ESTABLISHED", "LISTEN"]. UDP sockets have no state, so
+            they never match a states criterion.
+        :param names: (list) The process names to keep. This is the only criterion that needs the pid and name.
+
+        """
+        self.protocols = self.toList(protocols)
+        if self.protocols is not None:
+            self.protocols = [proto.lower() for proto in self.protocols]
+            for proto in self.protocols:
+                if proto not in PROC_NET_TABLES:
+                    raise ValueError(f"Unknown protocol {proto}, use one of: {', '.join(PROC_NET_TABLES)}.")
+        self.local_ports = self.toPortRanges(local_ports)
+        self.remote_ports = self.toPortRanges(remote_ports)
+        self.local_cidr = self.toNetworks(local_cidr)
+        self.remote_cidr = self.toNetworks(remote_cidr)
+        self.states = self.toList(states)
+        self.stateCodes = None
+        if self.states is not None:
+            self.states = [state.upper() for state in self.states]
+            codes = {name: code for code, name in TCP_STATES.items()}
+            for state in self.states:
+                if state not in codes:
+                    raise ValueError(f"Unknown state {state}, use one of: {', '.join(codes)}.")
+            self.stateCodes = {codes[state] for state in self.states}
+        self.names = self.toList(names)
+
+    @staticmethod
+    def toList(value):
+        """
+
+        This method wraps a single value in a list and leaves None and lists alone.
+
+        """
+        if value is None:
+            return None
+        if isinstance(value, (str, int, tuple, range)):
+            return [value]
+        return list(value)
+
+    @staticmethod
+    def toPortRanges(ports):
+        """
+
+        This method turns the accepted port forms into a list of inclusive (first, last) ranges.
+
+        """
+        ports = ConnectionFilter.toList(ports)
+        if ports is None:
+            return None
+        ranges = []
+        for port in ports:
+            if isinstance(port, int):
+                ranges.append((port, port))
+            elif isinstance(port, range):
+                ranges.append((port.start, port.stop - 1))
+            else:
+                first, last = port
+                ranges.append((first, last))
+        return ranges
+
+    @staticmethod
+    def toNetworks(cidrs):
+        """
+
+        This method parses one or more CIDR strings into ipaddress networks.
+
+        """
+        cidrs = ConnectionFilter.toList(cidrs)
+        if cidrs is None:
+            return None
+        return [ipaddress.ip_network(cidr, strict=False) for cidr in cidrs]
+
+    @staticmethod
+    def portIn(port, ranges):
+        """
+
+        This method checks if a port is inside one of the (first, last) ranges.
+
+        """
+        for first, last in ranges:
+            if first <= port <= last:
+                return True
+        return False
+
+    @staticmethod
+    def addressIn(address, networks):
+        """
+
+        This method checks if an address is inside one of the networks, treating IPv4-mapped IPv6 addresses as IPv4.
+
+        """
+        address = ipaddress.ip_address(address)
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        for network in networks:
+            if address.version == network.version and address in network:
+                return True
+        return False
+
+    def matchesPorts(self, local_port, remote_port):
+        """
+
+        This method checks the local and remote ports of a connection.
+
+        :return : (bool) True if both ports are allowed.
+
+        """
+        if self.local_ports is not None and not self.portIn(local_port, self.local_ports):
+            return False
+        if self.remote_ports is not None and not self.portIn(remote_port, self.remote_ports):
+            return False
+        return True
+
+    def matchesAddresses(self, local_address, remote_address):
+        """
+
+        This method checks the local and remote addresses of a connection against the networks of the filter.
+
+        :return : (bool) True if both addresses are allowed.
+
+        """
+        if self.local_cidr is not None and not self.addressIn(local_address, self.local_cidr):
+            return False
+        if self.remote_cidr is not None and not self.addressIn(remote_address, self.remote_cidr):
+            return False
+        return True
+
+    def matchesName(self, pid, resolveName):
+        """
+
+        This method checks the name of the process that owns a connection.
+
+        :param pid: (int) The pid of the connection, or None if it is unknown.
+        :param resolveName: (callable) Takes a pid and returns the name of the process.
+
+        :return : (bool) True if there is no name criterion or the process has one of the names.
+
+        """
+        if self.names is None:
+            return True
+        if pid is None:
+            return False
+        try:
+            return resolveName(pid) in self.names
+        except Exception:
+            # The process exited since the socket tables were read.
+            return False
+
+    def matches(self, conn):
+        """
+
+        This method checks every criterion except the process name against a whole Connection record.
+
+        :param conn: (Connection) The connection to check.
+
+        :return : (bool) True if the connection matches.
+
+        """
+        if self.protocols is not None and conn.proto.lower() not in self.protocols:
+            return False
+        if self.states is not None and conn.state not in self.states:
+            return False
+        if not self.matchesPorts(conn.local_port, conn.remote_port):
+            return False
+        try:
+            return self.matchesAddresses(conn.local_address, conn.remote_address)
+        except ValueError:
+            # netstat prints some wildcard addresses as *, which can not be in a network.
+            return False
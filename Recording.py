@@ -0,0 +1,317 @@
+"""
+
+
+This module records bandwidth samples to disk as fixed-width binary records and reads them back through mmap. The
+records go to numbered segment files in one directory, and a small JSON index keeps the time range of every closed
+segment, so a range query only maps the segments it needs and finds the first record with a binary search.
+
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+from Results import BandwidthResult
+
+"""
+
+A SampleRecord is one recorded sample. interface is an empty string for per-process samples.
+
+"""
+
+SampleRecord = namedtuple("SampleRecord", ["timestamp", "pid", "bytes_sent", "bytes_received", "elapsed_time",
+                                           "interface"])
+
+# timestamp, elapsed_time, pid, bytes_sent, bytes_received, interface (IFNAMSIZ bytes).
+RECORD = struct.Struct("<dfIQQ16s")
+# magic, version, record size.
+HEADER = struct.Struct("<8sII")
+MAGIC = b"NHSAMPLE"
+VERSION = 1
+INDEX_FILE = "index.json"
+
+
+def segmentName(number):
+    """
+
+    This function returns the file name of a segment.
+
+    :param number: (int) The number of the segment.
+
+    :return : (str) The file name.
+
+    """
+    return f"segment-{number:06d}.bin"
+
+
+class SampleRecorder:
+    """
+
+    The SampleRecorder class appends samples to the segments of a recording directory, starting a new segment when
+    the current one is full. Samples have to be appended in time order.
+
+    """
+
+    def __init__(self, directory, records_per_segment=1000000):
+        """
+
+        :param directory: (str) The recording directory, created if it does not exist.
+        :param records_per_segment: (int) The most records in one segment file.
+
+        """
+        self.directory = directory
+        self.records_per_segment = records_per_segment
+        os.makedirs(directory, exist_ok=True)
+        self.index = SampleReader.loadIndex(directory)
+        self.segment = None
+        self.number = 0
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.openSegment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def openSegment(self):
+        """
+
+        This method opens a new segment after the ones that are already in the directory.
+
+        """
+        numbers = [entry["number"] for entry in self.index]
+        existing = [int(name[8:14]) for name in os.listdir(self.directory)
+                    if name.startswith("segment-") and name.endswith(".bin")]
+        self.number = max(numbers + existing + [0]) + 1
+        self.segment = open(os.path.join(self.directory, segmentName(self.number)), "wb")
+        self.segment.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.count = 0
+        self.first = None
+        self.last = None
+
+    def closeSegment(self):
+        """
+
+        This method closes the current segment and adds it to the index.
+
+        """
+        if self.segment is None:
+            return
+        self.segment.close()
+        self.segment = None
+        if self.count:
+            self.index.append({"number": self.number, "file": segmentName(self.number), "records": self.count,
+                               "first": self.first, "last": self.last})
+        else:
+            os.remove(os.path.join(self.directory, segmentName(self.number)))
+        self.writeIndex()
+
+    def writeIndex(self):
+        """
+
+        This method replaces the index file, through a temporary file so a reader never sees half of it.
+
+        """
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + ".tmp", "w") as index:
+            json.dump(self.index, index)
+        os.replace(path + ".tmp", path)
+
+    def append(self, pid, bytes_sent, bytes_received, elapsed_time, timestamp=None, interface=""):
+        """
+
+        This method appends one sample.
+
+        :param pid: (int) The process id, 0 for an interface sample.
+        :param bytes_sent: (int) The bytes sent during the sample.
+        :param bytes_received: (int) The bytes received during the sample.
+        :param elapsed_time: (float) The length of the sample in seconds.
+        :param timestamp: (float) The time the sample ended, defaults to now.
+        :param interface: (str) The interface name for interface samples.
+
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self.count >= self.records_per_segment:
+            self.closeSegment()
+            self.openSegment()
+        self.segment.write(RECORD.pack(timestamp, elapsed_time, int(pid), max(int(bytes_sent), 0),
+                                       max(int(bytes_received), 0), interface.encode("ascii")[:16]))
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        self.count += 1
+
+    def appendResults(self, results, timestamp=None):
+        """
+
+        This method appends a list of BandwidthResult objects, all with the same timestamp.
+
+        :param results: (list) The results, None entries are skipped.
+        :param timestamp: (float) The time the samples ended, defaults to now.
+
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        for result in results:
+            if result is not None:
+                self.append(result.pid, result.bytes_sent, result.bytes_received, result.elapsed_time, timestamp)
+
+    def flush(self):
+        """
+
+        This method writes the buffered records to the segment file so readers can see them.
+
+        """
+        if self.segment is not None:
+            self.segment.flush()
+
+    def close(self):
+        """
+
+        This method closes the recording.
+
+        """
+        self.closeSegment()
+
+
+class SampleReader:
+    """
+
+    The SampleReader class answers time range queries over a recording directory. It maps the segments read-only and
+    decodes records straight out of the mapping, without copying or parsing the files.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def loadIndex(directory):
+        """
+
+        This method loads the index of the closed segments.
+
+        :param directory: (str) The recording directory.
+
+        :return : (list) The index entries, with the number, file, records, first and last timestamp of each segment.
+
+        """
+        try:
+            with open(os.path.join(directory, INDEX_FILE), "r") as index:
+                return json.load(index)
+        except (OSError, ValueError):
+            return []
+
+    def segments(self):
+        """
+
+        This method lists the segments of the recording, including the one that is still being written.
+
+        :return : (list) Index entries in segment order. first and last are None for a segment that is not indexed.
+
+        """
+        index = self.loadIndex(self.directory)
+        indexed = {entry["file"] for entry in index}
+        segments = list(index)
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith("segment-") and name.endswith(".bin") and name not in indexed:
+                segments.append({"number": int(name[8:14]), "file": name, "records": None, "first": None,
+                                 "last": None})
+        return sorted(segments, key=lambda entry: entry["number"])
+
+    def query(self, start=None, end=None, pid=None, interface=None):
+        """
+
+        This method yields the records of a time range.
+
+        :param start: (float) The earliest timestamp, defaults to the start of the recording.
+        :param end: (float) The latest timestamp, defaults to the end of the recording.
+        :param pid: (int) Optional process id to keep.
+        :param interface: (str) Optional interface name to keep.
+
+        :return : (generator) SampleRecord tuples in time order.
+
+        """
+        for entry in self.segments():
+            if entry["first"] is not None:
+                if (end is not None and entry["first"] > end) or (start is not None and entry["last"] < start):
+                    continue
+            for record in self.readSegment(entry["file"], start, end):
+                if pid is not None and record.pid != pid:
+                    continue
+                if interface is not None and record.interface != interface:
+                    continue
+                yield record
+
+    def readSegment(self, name, start=None, end=None):
+        """
+
+        This method yields the records of one segment within a time range.
+
+        :param name: (str) The file name of the segment.
+        :param start: (float) The earliest timestamp.
+        :param end: (float) The latest timestamp.
+
+        :return : (generator) SampleRecord tuples.
+
+        """
+        path = os.path.join(self.directory, name)
+        with open(path, "rb") as segment:
+            size = os.fstat(segment.fileno()).st_size
+            if size <= HEADER.size:
+                return
+            with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                magic, version, record_size = HEADER.unpack_from(mapping, 0)
+                if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                    raise ValueError(f"{path} is not a version {VERSION} sample segment")
+                # A record that is still being written is left out.
+                count = (size - HEADER.size) // RECORD.size
+                first = self.findFirst(mapping, count, start) if start is not None else 0
+                for position in range(first, count):
+                    timestamp, elapsed_time, pid, sent, received, interface = RECORD.unpack_from(
+                        mapping, HEADER.size + position * RECORD.size)
+                    if end is not None and timestamp > end:
+                        return
+                    yield SampleRecord(timestamp, pid, sent, received, elapsed_time,
+                                       interface.rstrip(b"\0").decode("ascii"))
+
+    @staticmethod
+    def findFirst(mapping, count, start):
+        """
+
+        This method finds the first record at or after a timestamp with a binary search.
+
+        :return : (int) The position of the record, count if there is none.
+
+        """
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from("<d", mapping, HEADER.size + middle * RECORD.size)[0] < start:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def replay(self, start=None, end=None, pid=None):
+        """
+
+        This method replays the per-process records of a time range as BandwidthResult objects.
+
+        :param start: (float) The earliest timestamp.
+        :param end: (float) The latest timestamp.
+        :param pid: (int) Optional process id to keep.
+
+        :return : (generator) (timestamp, BandwidthResult) tuples in time order.
+
+        """
+        for record in self.query(start, end, pid, interface=""):
+            yield record.timestamp, BandwidthResult(record.pid, record.bytes_sent, record.bytes_received,
+                                                    record.elapsed_time)
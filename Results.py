@@ -0,0 +1,192 @@
+"""
+
+
+This module defines the result type of the bandwidth methods. A result holds the raw byte counts of one process, the
+conversion to KB, MB or GB and the formatting of the messages only happen when they are asked for.
+
+"""
+
+# The unit arguments of the bandwidth methods, mapped to their divisor and label.
+UNITS = {
+    "-byte": (1, "bytes"),
+    "-b": (1, "bytes"),
+    "-kilobyte": (1024, "KB"),
+    "-k": (1024, "KB"),
+    "-megabyte": (1024 * 1024, "MB"),
+    "-m": (1024 * 1024, "MB"),
+    "-gigabyte": (1024 * 1024 * 1024, "GB"),
+    "-g": (1024 * 1024 * 1024, "GB"),
+}
+
+
+def unitFromArgs(args):
+    """
+
+    This function finds the unit argument in a list of arguments.
+
+    :param args: (list) The arguments, such as ["-kilobyte"].
+
+    :return : (str) The first unit argument, or None if there is none.
+
+    """
+    for arg in args:
+        if arg in UNITS:
+            return arg
+    return None
+
+
+class BandwidthResult:
+    """
+
+    The BandwidthResult class holds the bytes a process sent and received over an elapsed time, as integers.
+
+    It unpacks like the (pid, sent, received) tuples the bandwidth methods used to return, with the totals converted to
+    the unit it was asked for, and str() gives the message that used to be printed.
+
+    """
+
+    __slots__ = ("pid", "bytes_sent", "bytes_received", "elapsed_time", "interval", "unit", "ticks")
+
+    def __init__(self, pid, bytes_sent, bytes_received, elapsed_time, interval=None, unit="-byte", ticks=None):
+        """
+
+        :param pid: (int) The process id.
+        :param bytes_sent: (int) The total bytes sent.
+        :param bytes_received: (int) The total bytes received.
+        :param elapsed_time: (float) The time the bytes were counted over, in seconds.
+        :param interval: (int) The interval that was asked for, defaults to the elapsed time.
+        :param unit: (str) The unit argument used when the result is unpacked or formatted.
+        :param ticks: (list) Optional (elapsed_time, bytes_sent, bytes_received) samples, one per second.
+
+        """
+        self.pid = pid
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.elapsed_time = elapsed_time
+        self.interval = interval if interval is not None else elapsed_time
+        self.unit = unit
+        self.ticks = ticks
+
+    @classmethod
+    def fromTicks(cls, pid, ticks, interval=None, unit="-byte"):
+        """
+
+        This method builds a result out of second by second samples.
+
+        :param pid: (int) The process id.
+        :param ticks: (list) (elapsed_time, bytes_sent, bytes_received) samples.
+        :param interval: (int) The interval that was asked for.
+        :param unit: (str) The unit argument.
+
+        :return : (BandwidthResult) The result with the totals of all the samples.
+
+        """
+        return cls(pid, sum(tick[1] for tick in ticks), sum(tick[2] for tick in ticks),
+                   sum(tick[0] for tick in ticks), interval, unit, ticks)
+
+    @property
+    def sent_rate(self):
+        """The bytes sent per second."""
+        return self.bytes_sent / self.elapsed_time if self.elapsed_time else 0.0
+
+    @property
+    def received_rate(self):
+        """The bytes received per second."""
+        return self.bytes_received / self.elapsed_time if self.elapsed_time else 0.0
+
+    def convert(self, unit=None):
+        """
+
+        This method converts the totals and the rates to a unit.
+
+        :param unit: (str) A unit argument such as -kilobyte or -k, defaults to the unit of the result.
+
+        :return : (float) sent, (float) received, (float) sent per second, (float) received per second.
+
+        """
+        divisor = UNITS[unit or self.unit][0]
+        return (self.bytes_sent / divisor, self.bytes_received / divisor,
+                self.sent_rate / divisor, self.received_rate / divisor)
+
+    def __iter__(self):
+        divisor = UNITS[self.unit][0]
+        return iter((self.pid, self.bytes_sent / divisor, self.bytes_received / divisor))
+
+    def __repr__(self):
+        return (f"BandwidthResult(pid={self.pid}, bytes_sent={self.bytes_sent}, "
+                f"bytes_received={self.bytes_received}, elapsed_time={self.elapsed_time:.3f})")
+
+    @staticmethod
+    def formatTick(pid, seconds, bytes_sent, bytes_received, unit="-byte"):
+        """
+
+        This method formats the running rate after a number of second by second samples, as the second by second mode
+        prints it.
+
+        :param pid: (int) The process id.
+        :param seconds: (int) The number of samples so far.
+        :param bytes_sent: (int) The bytes sent over those samples.
+        :param bytes_received: (int) The bytes received over those samples.
+        :param unit: (str) A unit argument such as -kilobyte or -k.
+
+        :return : (str) The message.
+
+        """
+        divisor, label = UNITS[unit]
+        sent = bytes_sent / divisor / seconds
+        received = bytes_received / divisor / seconds
+        return (f"Process {pid} sent {sent:.3f} {label}/s and received {received:.3f} {label}/s. "
+                f"{seconds} seconds elapsed.")
+
+    def format(self, unit=None):
+        """
+
+        This method formats the result the way the bandwidth methods print it.
+
+        :param unit: (str) A unit argument, defaults to the unit of the result.
+
+        :return : (str) The message.
+
+        """
+        label = UNITS[unit or self.unit][1]
+        sent, received, sent_rate, received_rate = self.convert(unit)
+        total = (f"With a Total of {sent:.3f} {label} sent, and {received:.3f} {label} received, over approximately "
+                 f"{self.interval} seconds.")
+        if self.ticks is not None:
+            lines = []
+            bytes_sent = bytes_received = 0
+            for seconds, (_, tick_sent, tick_received) in enumerate(self.ticks, 1):
+                bytes_sent += tick_sent
+                bytes_received += tick_received
+                lines.append(self.formatTick(self.pid, seconds, bytes_sent, bytes_received, unit or self.unit))
+            return "\n".join(lines) + "\n\n" + total
+        return (f"Process {self.pid} sent {sent_rate:.3f} {label}/s and received {received_rate:.3f} {label}/s. "
+                + total)
+
+    def __str__(self):
+        return self.format()
+
+
+def convertResults(results, unit="-byte"):
+    """
+
+    This function converts a list of results to one unit in a single pass.
+
+    :param results: (list) BandwidthResult objects, None entries are skipped.
+    :param unit: (str) A unit argument such as -megabyte or -m.
+
+    :return : (list) (pid, sent, received, sent per second, received per second) tuples in the unit.
+
+    """
+    if unit not in UNITS:
+        raise ValueError(f"Invalid unit {unit}. Please use one of the following: {', '.join(UNITS)}.")
+    divisor = UNITS[unit][0]
+    converted = []
+    for result in results:
+        if result is None:
+            continue
+        rate_divisor = result.elapsed_time * divisor
+        converted.append((result.pid, result.bytes_sent / divisor, result.bytes_received / divisor,
+                          result.bytes_sent / rate_divisor if rate_divisor else 0.0,
+                          result.bytes_received / rate_divisor if rate_divisor else 0.0))
+    return converted
@@ -0,0 +1,237 @@
+"""
+
+
+This module samples processes and interfaces at a rate that follows their activity. A key that moved bytes since its
+last sample is sampled again after the shortest interval, an idle one waits twice as long each time up to the longest
+interval. Every key that is due around the same time is read in one batched tick, and the ticks are held to a CPU
+time budget, so the sampler stays cheap on a busy host however many processes it follows.
+
+"""
+
+import time
+
+import psutil
+
+from Monitor import BandwidthMonitor
+
+
+class AdaptiveScheduler(BandwidthMonitor):
+    """
+
+    The AdaptiveScheduler class is a BandwidthMonitor that keeps its own interval per process and interface. It stores
+    the same history and answers the same queries.
+
+    The CPU budget is a token bucket: it refills at cpu_budget seconds of CPU per second and every tick takes the CPU
+    time it used out of it. When the bucket is empty the next tick waits until it refilled, and the work that became
+    due in the meantime is merged into that tick.
+
+    """
+
+    def __init__(self, helper=None, pids=None, min_interval=1.0, max_interval=30.0, cpu_budget=0.05, history=3600,
+                 max_series=10000, recorder=None, busy_bytes=1, include_interfaces=True, discover_interval=None):
+        """
+
+        :param helper: (NetWorkHelper) The helper whose counter source is sampled, a new one by default.
+        :param pids: (list) The process ids to follow, defaults to the processes with a socket, found again every
+            discover_interval.
+        :param min_interval: (float) The interval of a busy process or interface, in seconds.
+        :param max_interval: (float) The longest interval of an idle process or interface, in seconds.
+        :param cpu_budget: (float) The CPU seconds the ticks may use per second, such as 0.05 for 5% of a core, or None
+            for no limit.
+        :param history: (int) The number of samples kept per process and interface.
+        :param max_series: (int) The most processes and interfaces kept, the ones not seen for longest are dropped.
+        :param recorder: (SampleRecorder) Optional recorder every sample is also appended to.
+        :param busy_bytes: (int) The bytes sent and received during a sample that make a key busy.
+        :param include_interfaces: (bool) True to sample the interfaces too, false if not.
+        :param discover_interval: (float) The time between two looks for new processes, defaults to max_interval.
+
+        """
+        super().__init__(helper, pids, min_interval, history, max_series, recorder)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cpu_budget = cpu_budget
+        self.busy_bytes = busy_bytes
+        self.include_interfaces = include_interfaces
+        self.discover_interval = discover_interval if discover_interval is not None else max_interval
+        # Work that is due within this many seconds is done in the current tick.
+        self.slack = min_interval / 2
+        # (kind, key) -> [counters, timestamp, interval, due], due on the monotonic clock.
+        self.schedule = {}
+        self.nextDiscovery = 0.0
+        self.credit = cpu_budget or 0.0
+        self.lastRefill = None
+        self.ticks = 0
+        self.cpuTime = 0.0
+        self.throttledTime = 0.0
+
+    def run(self):
+        """
+
+        This method is the body of the sampling thread. It sleeps until the next key is due, or until the CPU budget
+        refilled if the last ticks used it up.
+
+        """
+        while not self.stopEvent.is_set():
+            now = time.monotonic()
+            if self.cpu_budget:
+                self.refill(now)
+            throttled = self.cpu_budget and self.credit < 0
+            if throttled:
+                delay = -self.credit / self.cpu_budget
+            else:
+                start_cpu = time.thread_time()
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"Something went wrong while sampling: {e}")
+                used = time.thread_time() - start_cpu
+                self.cpuTime += used
+                self.credit -= used
+                delay = self.nextDue() - time.monotonic()
+            self.stopEvent.wait(max(delay, 0))
+            if throttled:
+                self.throttledTime += time.monotonic() - now
+
+    def refill(self, now):
+        """
+
+        This method adds the CPU time earned since the last refill to the budget, up to one second's worth.
+
+        """
+        if self.lastRefill is not None:
+            self.credit = min(self.credit + (now - self.lastRefill) * self.cpu_budget, self.cpu_budget)
+        self.lastRefill = now
+
+    def nextDue(self):
+        """
+
+        This method finds when the next tick is needed.
+
+        :return : (float) The monotonic time the first key is due or the next discovery, whichever comes first.
+
+        """
+        due = min((entry[3] for entry in self.schedule.values()), default=time.monotonic() + self.min_interval)
+        if not self.pids:
+            due = min(due, self.nextDiscovery)
+        return due
+
+    def discover(self, now):
+        """
+
+        This method adds the processes that opened a socket since the last discovery and drops the ones that have
+        none anymore.
+
+        """
+        if self.pids:
+            pids = {int(pid) for pid in self.pids}
+        else:
+            pids = set(self.helper.iterConnections().pids())
+        with self.lock:
+            for kind, key in list(self.schedule):
+                if kind == "pid" and key not in pids:
+                    del self.schedule[(kind, key)]
+            for pid in pids:
+                if ("pid", pid) not in self.schedule:
+                    self.schedule[("pid", pid)] = [None, None, self.min_interval, now]
+        self.nextDiscovery = now + self.discover_interval
+
+    def tick(self):
+        """
+
+        This method samples every process and interface that is due, with one read of the counter source for all of
+        the processes and one read of the interface counters.
+
+        """
+        now = time.monotonic()
+        discovering = not self.schedule or (not self.pids and now >= self.nextDiscovery)
+        if discovering:
+            self.discover(now)
+        due = now + self.slack
+        duePids = [key for (kind, key), entry in self.schedule.items() if kind == "pid" and entry[3] <= due]
+        interfacesDue = self.include_interfaces and (
+            discovering or any(kind == "interface" and entry[3] <= due for (kind, key), entry in self.schedule.items()))
+
+        pidCounters = self.helper.counterSource(duePids) if duePids else {}
+        interfaceCounters = {}
+        if interfacesDue:
+            interfaceCounters = {name: (counters.bytes_sent, counters.bytes_recv)
+                                 for name, counters in psutil.net_io_counters(pernic=True).items()}
+        timestamp = time.time()
+        now = time.monotonic()
+
+        with self.lock:
+            for pid in duePids:
+                self.update("pid", pid, pidCounters.get(pid), timestamp, now)
+            for name, counters in interfaceCounters.items():
+                entry = self.schedule.get(("interface", name))
+                if entry is None:
+                    self.schedule[("interface", name)] = [counters, timestamp, self.min_interval,
+                                                          now + self.min_interval]
+                elif entry[3] <= due:
+                    self.update("interface", name, counters, timestamp, now)
+            self.evict(self.pidSeries)
+            self.evict(self.interfaceSeries)
+        self.ticks += 1
+        if self.recorder is not None:
+            self.recorder.flush()
+
+    def update(self, kind, key, counters, timestamp, now):
+        """
+
+        This method stores the sample of one key and schedules its next one. A key that moved at least busy_bytes
+        goes back to the shortest interval, an idle one doubles its interval. The caller has to hold the lock.
+
+        :param kind: (str) pid or interface.
+        :param key: The pid or the interface name.
+        :param counters: (tuple) The (bytes_sent, bytes_received) counters, or None if they could not be read.
+        :param timestamp: (float) The time the counters were read.
+        :param now: (float) The same time on the monotonic clock.
+
+        """
+        entry = self.schedule[(kind, key)]
+        previous, previous_time, interval, _ = entry
+        if counters is None:
+            interval = min(interval * 2, self.max_interval)
+        elif previous is not None:
+            bytes_sent, bytes_received = counters[0] - previous[0], counters[1] - previous[1]
+            seriesMap = self.pidSeries if kind == "pid" else self.interfaceSeries
+            self.appendSample(seriesMap, kind, key, timestamp, timestamp - previous_time, bytes_sent, bytes_received)
+            if bytes_sent + bytes_received >= self.busy_bytes:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+        if counters is not None:
+            entry[0], entry[1] = counters, timestamp
+        entry[2], entry[3] = interval, now + interval
+
+    def getInterval(self, key, kind="pid"):
+        """
+
+        This method returns the current sampling interval of a process or interface.
+
+        :param key: The pid, or the interface name when kind is interface.
+        :param kind: (str) pid or interface.
+
+        :return : (float) The interval in seconds, or None if the key is not scheduled.
+
+        """
+        if kind == "pid":
+            key = int(key)
+        with self.lock:
+            entry = self.schedule.get((kind, key))
+            return entry[2] if entry is not None else None
+
+    def getSchedulerStats(self):
+        """
+
+        This method returns how much work the scheduler did.
+
+        :return : (dict) The number of ticks, the CPU seconds they used, the budget, the seconds ticks were held back
+        to stay within it, and the number of scheduled processes and interfaces.
+
+        """
+        with self.lock:
+            pids = sum(1 for kind, key in self.schedule if kind == "pid")
+            interfaces = len(self.schedule) - pids
+        return {"ticks": self.ticks, "cpu_time": self.cpuTime, "cpu_budget": self.cpu_budget,
+                "throttled_time": self.throttledTime, "pids": pids, "interfaces": interfaces}
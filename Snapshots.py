@@ -0,0 +1,175 @@
+"""
+
+
+This module keeps snapshots of the socket tables and diffs them, so a poller only has to look at the connections
+that opened, closed or changed state since the previous poll. The pid and name of a connection are only looked up
+when it first shows up, and carried over from the previous snapshot after that.
+
+"""
+
+import time
+from collections import namedtuple
+
+from ProcNet import ProcNetReader
+
+"""
+
+A ConnectionDiff lists the connections that opened and closed between two snapshots, the (old, new) pairs of the ones
+whose state changed, and the names of the processes of the opened connections when names are resolved.
+
+"""
+
+ConnectionDiff = namedtuple("ConnectionDiff", ["opened", "closed", "changed", "names"])
+
+
+def connectionKey(conn):
+    """
+
+    This function returns the key a connection is tracked by. Sockets that were closed by their process, such as
+    the ones in TIME_WAIT, have no inode anymore, so such a socket shows up as one closed and one opened connection.
+
+    :param conn: (Connection) The connection.
+
+    :return : (tuple) The protocol, the local and remote endpoints and the inode.
+
+    """
+    return conn.proto, conn.local_address, conn.local_port, conn.remote_address, conn.remote_port, conn.inode
+
+
+class ConnectionSnapshot:
+    """
+
+    The ConnectionSnapshot class holds the connections of the socket tables at one point in time, by their key.
+
+    """
+
+    def __init__(self, connections, timestamp=None):
+        self.connections = connections
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    def __len__(self):
+        return len(self.connections)
+
+    @classmethod
+    def capture(cls, reader=None, protocols=None, connFilter=None):
+        """
+
+        This method reads the socket tables without looking up any pids.
+
+        :param reader: (ProcNetReader) The reader to use, a new one by default.
+        :param protocols: (list) The tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param connFilter: (ConnectionFilter) Optional filter the connections have to match.
+
+        :return : (ConnectionSnapshot) The snapshot.
+
+        """
+        if reader is None:
+            reader = ProcNetReader()
+        return cls({connectionKey(conn): conn
+                    for conn in reader.iterConnections(protocols, resolve_pids=False, connFilter=connFilter)})
+
+    def diff(self, previous):
+        """
+
+        This method compares the snapshot with an older one.
+
+        :param previous: (ConnectionSnapshot) The older snapshot, or None to treat every connection as opened.
+
+        :return : (ConnectionDiff) The opened and closed connections and the (old, new) pairs that changed state.
+
+        """
+        if previous is None:
+            return ConnectionDiff(list(self.connections.values()), [], [], {})
+        old = previous.connections
+        opened = [conn for key, conn in self.connections.items() if key not in old]
+        closed = [conn for key, conn in old.items() if key not in self.connections]
+        changed = [(old[key], conn) for key, conn in self.connections.items()
+                   if key in old and old[key].state != conn.state]
+        return ConnectionDiff(opened, closed, changed, {})
+
+
+class ConnectionTracker:
+    """
+
+    The ConnectionTracker class polls the socket tables and returns what changed since the previous poll. Only the
+    inodes of newly opened connections are looked up, the pids of the others are carried over.
+
+    """
+
+    def __init__(self, reader=None, protocols=None, connFilter=None, resolveName=None):
+        """
+
+        :param reader: (ProcNetReader) The reader to use, a new one by default.
+        :param protocols: (list) The tables to read, defaults to tcp, tcp6, udp and udp6.
+        :param connFilter: (ConnectionFilter) Optional filter the connections have to match. Its names criterion is
+            checked once per opened connection, after its pid is looked up.
+        :param resolveName: (callable) Optional function that takes a pid and returns its name, used to name the
+            processes of the opened connections. It is required when the filter has a names criterion.
+
+        """
+        if connFilter is not None and connFilter.names is not None and resolveName is None:
+            raise ValueError("Filtering connections by process name needs a resolveName function.")
+        self.reader = reader if reader is not None else ProcNetReader()
+        self.protocols = protocols
+        self.connFilter = connFilter
+        self.resolveName = resolveName
+        self.snapshot = None
+        # The keys of the open connections whose process did not match the names criterion.
+        self.excluded = set()
+
+    def poll(self):
+        """
+
+        This method takes a new snapshot and diffs it against the previous one. The first poll reports every
+        connection as opened.
+
+        :return : (ConnectionDiff) The changes, with the pid field of every connection filled in where it is known.
+
+        """
+        current = ConnectionSnapshot.capture(self.reader, self.protocols, self.connFilter)
+        if self.excluded:
+            # Connections that were left out when they opened stay left out until they close.
+            self.excluded &= current.connections.keys()
+            for key in self.excluded:
+                del current.connections[key]
+        change = current.diff(self.snapshot)
+
+        opened = change.opened
+        if opened:
+            inodeIndex = self.reader.buildInodeIndex(inodes={conn.inode for conn in opened})
+            opened = [conn._replace(pid=inodeIndex.get(conn.inode)) for conn in opened]
+            if self.connFilter is not None and self.connFilter.names is not None:
+                matched = []
+                for conn in opened:
+                    if self.connFilter.matchesName(conn.pid, self.resolveName):
+                        matched.append(conn)
+                    else:
+                        key = connectionKey(conn)
+                        self.excluded.add(key)
+                        del current.connections[key]
+                opened = matched
+            for conn in opened:
+                current.connections[connectionKey(conn)] = conn
+        changed = []
+        for old, new in change.changed:
+            new = new._replace(pid=old.pid)
+            current.connections[connectionKey(new)] = new
+            changed.append((old, new))
+        if self.snapshot is not None:
+            # Carry the pids of the connections that did not change over to the new snapshot.
+            for key, conn in self.snapshot.connections.items():
+                if key in current.connections and current.connections[key].pid is None and conn.pid is not None:
+                    current.connections[key] = current.connections[key]._replace(pid=conn.pid)
+
+        names = {}
+        if self.resolveName is not None:
+            for conn in opened:
+                if conn.pid is not None and conn.pid not in names:
+                    try:
+                        names[conn.pid] = self.resolveName(conn.pid)
+                    except Exception:
+                        # The process exited since the socket tables were read.
+                        continue
+
+        self.snapshot = current
+        return ConnectionDiff(opened, change.closed, changed, names)
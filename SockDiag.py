@@ -0,0 +1,193 @@
+"""
+
+
+This module collects per-process TCP byte counters through the NETLINK_INET_DIAG (sock_diag) interface. One dump
+request per address family returns every TCP socket together with its tcp_info, which holds the bytes_acked and
+bytes_received counters. The sockets are joined to their processes through the socket inode index of ProcNetReader.
+
+"""
+
+import socket
+import struct
+import threading
+
+from ProcNet import ProcNetReader
+
+NETLINK_INET_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+INET_DIAG_INFO = 2
+
+# struct nlmsghdr, struct inet_diag_req_v2 and struct inet_diag_msg from linux/netlink.h and linux/inet_diag.h.
+NLMSGHDR = struct.Struct("=IHHII")
+INET_DIAG_REQ_V2 = struct.Struct("=BBBBI48s")
+INET_DIAG_MSG = struct.Struct("=BBBB48sIIIII")
+RTATTR = struct.Struct("=HH")
+# bytes_acked and bytes_received of struct tcp_info, available since Linux 4.1.
+TCP_INFO_BYTES = struct.Struct("=QQ")
+TCP_INFO_BYTES_OFFSET = 120
+
+ALL_TCP_STATES = 0xFFFFFFFF
+
+
+class SockDiagCollector:
+    """
+
+    The SockDiagCollector class dumps all TCP sockets over netlink and sums their byte counters per process.
+
+    """
+
+    def __init__(self, proc_root="/proc"):
+        self.reader = ProcNetReader(proc_root)
+        self.sequence = 0
+        # The last counters seen for every socket inode, and the running totals of every pid.
+        self.lastSockets = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def isSupported():
+        """
+
+        This method checks if a NETLINK_INET_DIAG socket can be opened on this system.
+
+        :return : (bool) True if sock_diag is available, false if not.
+
+        """
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_INET_DIAG)
+        except (AttributeError, OSError):
+            return False
+        sock.close()
+        return True
+
+    def dumpFamily(self, sock, family):
+        """
+
+        This method sends one dump request for a single address family and reads back all of its TCP sockets.
+
+        :param sock: (socket) An open NETLINK_INET_DIAG socket.
+        :param family: (int) socket.AF_INET or socket.AF_INET6.
+
+        :return : (dict) The socket inodes as keys and (bytes_acked, bytes_received) tuples as values.
+
+        """
+        self.sequence += 1
+        request = INET_DIAG_REQ_V2.pack(family, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1), 0, ALL_TCP_STATES,
+                                        b"\0" * 48)
+        sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(request), SOCK_DIAG_BY_FAMILY, NLM_F_REQUEST | NLM_F_DUMP,
+                                self.sequence, 0) + request)
+
+        sockets = {}
+        while True:
+            data = sock.recv(1 << 16)
+            offset = 0
+            while offset + NLMSGHDR.size <= len(data):
+                length, msgType, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+                if length < NLMSGHDR.size:
+                    return sockets
+                if msgType == NLMSG_DONE:
+                    return sockets
+                if msgType == NLMSG_ERROR:
+                    errno = -struct.unpack_from("=i", data, offset + NLMSGHDR.size)[0]
+                    raise OSError(errno, "sock_diag dump failed")
+                if msgType == SOCK_DIAG_BY_FAMILY:
+                    sockets.update(self.parseMessage(data, offset + NLMSGHDR.size, offset + length))
+                offset += (length + 3) & ~3
+
+    @staticmethod
+    def parseMessage(data, start, end):
+        """
+
+        This method reads the inode and the tcp_info byte counters out of one inet_diag_msg.
+
+        :param data: (bytes) The netlink buffer.
+        :param start: (int) The offset of the inet_diag_msg.
+        :param end: (int) The end of the netlink message.
+
+        :return : (dict) The socket inode as key and its (bytes_acked, bytes_received) as value, or an empty dict.
+
+        """
+        inode = INET_DIAG_MSG.unpack_from(data, start)[-1]
+        offset = start + INET_DIAG_MSG.size
+        while offset + RTATTR.size <= end:
+            attrLength, attrType = RTATTR.unpack_from(data, offset)
+            if attrLength < RTATTR.size:
+                break
+            if attrType == INET_DIAG_INFO:
+                payload = attrLength - RTATTR.size
+                if payload < TCP_INFO_BYTES_OFFSET + TCP_INFO_BYTES.size:
+                    # The kernel is too old to report byte counters.
+                    return {}
+                return {inode: TCP_INFO_BYTES.unpack_from(data, offset + RTATTR.size + TCP_INFO_BYTES_OFFSET)}
+            offset += (attrLength + 3) & ~3
+        return {}
+
+    def dumpSockets(self):
+        """
+
+        This method dumps the IPv4 and IPv6 TCP sockets of the system.
+
+        :return : (dict) The socket inodes as keys and (bytes_acked, bytes_received) tuples as values.
+
+        """
+        sockets = {}
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_INET_DIAG) as sock:
+            for family in (socket.AF_INET, socket.AF_INET6):
+                sockets.update(self.dumpFamily(sock, family))
+        return sockets
+
+    def applySockets(self, sockets, inodeIndex):
+        """
+
+        This method adds the bytes every socket moved since the last dump to the totals of its process. The counters
+        of a socket only grow, so a socket whose counters are below the stored ones is skipped and can not count the
+        same bytes twice. The caller has to hold the lock.
+
+        :param sockets: (dict) The socket inodes as keys and (bytes_acked, bytes_received) tuples as values.
+        :param inodeIndex: (dict) The socket inodes as keys and the owning PIDs as values.
+
+        """
+        for inode, (bytes_acked, bytes_received) in sockets.items():
+            pid = inodeIndex.get(inode)
+            if pid is None:
+                continue
+            last_acked, last_received = self.lastSockets.get(inode, (0, 0))
+            if bytes_acked < last_acked or bytes_received < last_received:
+                continue
+            sent, received = self.totals.get(pid, (0, 0))
+            self.totals[pid] = (sent + bytes_acked - last_acked, received + bytes_received - last_received)
+            self.lastSockets[inode] = (bytes_acked, bytes_received)
+
+    def counters(self, pids):
+        """
+
+        This method returns the bytes sent and received by each process. The socket counters only cover the lifetime
+        of a socket, so the collector keeps a running total per pid that does not go backwards when a socket closes.
+
+        :param pids: (list) The process ids to read the counters for.
+
+        :return : (dict) The pids as keys and (bytes_sent, bytes_received) tuples as values. Processes that do not
+        exist, or exited since a previous call, are left out.
+
+        """
+        pids = [int(pid) for pid in pids]
+
+        # The dump is taken under the lock too, so concurrent callers apply their dumps in the order they were taken.
+        with self.lock:
+            inodeIndex = self.reader.buildInodeIndex(pids)
+            sockets = self.dumpSockets()
+            self.applySockets(sockets, inodeIndex)
+
+            # Forget the sockets that were closed and the processes that exited.
+            for inode in [inode for inode in self.lastSockets if inode not in sockets]:
+                del self.lastSockets[inode]
+            for pid in [pid for pid in self.totals if not self.reader.pidExists(pid)]:
+                del self.totals[pid]
+
+            # A live process without any TCP socket has sent nothing yet, a dead one has no counters at all.
+            return {pid: self.totals.get(pid, (0, 0)) for pid in pids
+                    if pid in self.totals or self.reader.pidExists(pid)}
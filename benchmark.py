@@ -0,0 +1,265 @@
+"""
+
+
+This script benchmarks NetWorkHelper offline. It writes synthetic /proc/net socket tables and /proc/<pid>/fd socket
+links into a temporary directory, swaps the counters for a fake source, and measures the parse throughput, the name
+resolution cost, the peak memory and the end-to-end getAllBandwidth wall time. The results are saved as JSON so two
+runs can be compared.
+
+usage: python benchmark.py [--sizes 1000,10000,100000,1000000] [--output bench_results.json]
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from NameCache import ProcessNameCache
+from NetworkHelper import NetWorkHelper
+from ProcNet import ConnectionFilter, ProcNetReader
+
+TABLE_HEADER = ("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout "
+                "inode\n")
+TCP_STATE_CODES = ["01", "01", "01", "06", "0A", "08"]
+
+
+def encodeAddress(raw):
+    """
+
+    This function encodes a packed address the way the kernel prints it in /proc/net, as hex words in host order.
+
+    :param raw: (bytes) The packed address, 4 or 16 bytes.
+
+    :return : (str) The hex address.
+
+    """
+    if sys.byteorder == "little":
+        raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    return raw.hex().upper()
+
+
+def makeProcTree(root, connections, max_fds, seed=0):
+    """
+
+    This function writes a fake proc filesystem with the given number of connections, spread over the four socket
+    tables and owned by one process per 50 sockets.
+
+    :param root: (str) The directory to write the tree in.
+    :param connections: (int) The number of sockets to write.
+    :param max_fds: (int) The most socket links to create, the sockets after that have no owning process.
+    :param seed: (int) The random seed, so two runs use the same fixture.
+
+    :return : (list) The fake process ids.
+
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "net"), exist_ok=True)
+    pids = list(range(1000, 1000 + max(connections // 50, 1)))
+    tables = {name: open(os.path.join(root, "net", name), "w") for name in ("tcp", "tcp6", "udp", "udp6")}
+    try:
+        for table in tables.values():
+            table.write(TABLE_HEADER)
+        for row in range(connections):
+            name = ("tcp", "tcp", "tcp", "tcp6", "tcp6", "udp", "udp6")[row % 7]
+            if name.endswith("6"):
+                local = encodeAddress(b"\0" * 10 + b"\xff\xff" + struct.pack("!I", rng.getrandbits(32)))
+                remote = encodeAddress(struct.pack("!QQ", rng.getrandbits(64), rng.getrandbits(64)))
+            else:
+                local = encodeAddress(struct.pack("!I", rng.getrandbits(32)))
+                remote = encodeAddress(struct.pack("!I", rng.getrandbits(32)))
+            state = rng.choice(TCP_STATE_CODES) if name.startswith("tcp") else "07"
+            tables[name].write(f"{row:5d}: {local}:{rng.choice((80, 443, rng.randrange(1024, 65536))):04X} "
+                               f"{remote}:{rng.randrange(1, 65536):04X} {state} 00000000:00000000 00:00000000 "
+                               f"00000000  1000        0 {100000 + row} 1 0000000000000000 100 0 0 10 0\n")
+    finally:
+        for table in tables.values():
+            table.close()
+
+    for pid in pids:
+        os.makedirs(os.path.join(root, str(pid), "fd"), exist_ok=True)
+    for row in range(min(connections, max_fds)):
+        pid = pids[row % len(pids)]
+        os.symlink(f"socket:[{100000 + row}]", os.path.join(root, str(pid), "fd", str(row)))
+    return pids
+
+
+class FakeCounterSource:
+    """
+
+    The FakeCounterSource class stands in for the per-process counters. Every call moves the counters of every pid
+    forward by a fixed random amount, so the results are deterministic and nothing is read from the system.
+
+    """
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.counters = {}
+        self.calls = 0
+
+    def __call__(self, pids):
+        self.calls += 1
+        result = {}
+        for pid in pids:
+            sent, received = self.counters.get(pid, (0, 0))
+            sent += self.rng.randrange(0, 1 << 20)
+            received += self.rng.randrange(0, 1 << 20)
+            self.counters[pid] = result[pid] = (sent, received)
+        return result
+
+
+def timed(function, *args, **kwargs):
+    """
+
+    This function runs a function twice, once for the wall time and once under tracemalloc for the peak memory, since
+    tracing slows the code down too much to time it at the same time.
+
+    :return : The result, (float) the seconds it took, (int) the peak memory in bytes.
+
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    elapsed_time = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed_time, peak
+
+
+def benchmarkSize(connections, max_fds, interval):
+    """
+
+    This function runs every benchmark against one fixture size.
+
+    :param connections: (int) The number of sockets in the fixture.
+    :param max_fds: (int) The most socket links to create.
+    :param interval: (float) The interval used for getAllBandwidth.
+
+    :return : (dict) The results.
+
+    """
+    root = tempfile.mkdtemp(prefix="netstat-bench-")
+    try:
+        start = time.perf_counter()
+        makeProcTree(root, connections, max_fds)
+        setup_time = time.perf_counter() - start
+        reader = ProcNetReader(root)
+        results = {"connections": connections, "fixture_seconds": setup_time}
+
+        rows, elapsed_time, peak = timed(lambda: sum(1 for _ in reader.iterConnections(resolve_pids=False)))
+        results["stream_parse"] = {"rows": rows, "seconds": elapsed_time, "rows_per_second": rows / elapsed_time,
+                                   "peak_bytes": peak}
+
+        rows, elapsed_time, peak = timed(lambda: sum(1 for _ in reader.iterConnections()))
+        results["resolved_stream_parse"] = {"rows": rows, "seconds": elapsed_time,
+                                            "rows_per_second": rows / elapsed_time, "peak_bytes": peak}
+
+        rows, elapsed_time, peak = timed(lambda: len(reader.getConnections(resolve_pids=False)))
+        results["list_parse"] = {"rows": rows, "seconds": elapsed_time, "rows_per_second": rows / elapsed_time,
+                                 "peak_bytes": peak}
+
+        index, elapsed_time, peak = timed(reader.buildInodeIndex)
+        results["inode_index"] = {"inodes": len(index), "seconds": elapsed_time, "peak_bytes": peak}
+
+        connFilter = ConnectionFilter(states="ESTABLISHED", local_ports=443)
+        rows, elapsed_time, peak = timed(lambda: sum(1 for _ in reader.iterConnections(connFilter=connFilter)))
+        results["filtered_parse"] = {"rows": rows, "seconds": elapsed_time, "peak_bytes": peak}
+
+        text = ProcNetReader.formatConnections(reader.iterConnections())
+        helper = NetWorkHelper()
+        pids, elapsed_time, peak = timed(lambda: list(helper.iterPids(text)))
+        results["text_parse"] = {"rows": text.count("\n"), "seconds": elapsed_time, "peak_bytes": peak}
+        del text
+
+        # timed() runs getAllBandwidth twice, so the counter reads of one run are half of the calls.
+        helper.counterSource = FakeCounterSource()
+        fakePids = sorted({int(name) for name in os.listdir(root) if name.isdigit()})
+        bandwidth, elapsed_time, peak = timed(helper.getAllBandwidth, fakePids, interval, print_output=False)
+        results["get_all_bandwidth"] = {"pids": len(fakePids), "interval": interval, "seconds": elapsed_time,
+                                        "overhead_seconds": elapsed_time - interval, "peak_bytes": peak,
+                                        "counter_reads": helper.counterSource.calls // 2}
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def benchmarkNames(lookups):
+    """
+
+    This function measures the name resolution of the real processes of this system, cold and through the cache.
+
+    :param lookups: (int) The number of lookups to make.
+
+    :return : (dict) The results.
+
+    """
+    pids = ProcNetReader().listPids() or [os.getpid()]
+    pidList = [pids[i % len(pids)] for i in range(lookups)]
+    cache = ProcessNameCache(max_size=len(pids) + 1)
+
+    def resolve():
+        for pid in pidList:
+            try:
+                cache.get(pid)
+            except Exception:
+                pass
+
+    start = time.perf_counter()
+    resolve()
+    cold_time = time.perf_counter() - start
+    start = time.perf_counter()
+    resolve()
+    warm_time = time.perf_counter() - start
+    return {"lookups": lookups, "processes": len(pids), "cold_seconds": cold_time, "warm_seconds": warm_time,
+            "cache": cache.stats()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NetWorkHelper against synthetic socket tables.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated connection counts, for example 1000,10000,100000,1000000")
+    parser.add_argument("--max-fds", type=int, default=100000, help="the most socket links to create per fixture")
+    parser.add_argument("--interval", type=float, default=0.5, help="the getAllBandwidth interval in seconds")
+    parser.add_argument("--lookups", type=int, default=10000, help="the number of name lookups to time")
+    parser.add_argument("--output", default="bench_results.json", help="the JSON file to write the results to")
+    options = parser.parse_args(argv)
+
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "hostname": socket.gethostname(),
+        "sizes": [],
+    }
+    for size in (int(size) for size in options.sizes.split(",")):
+        print(f"Benchmarking {size} connections...")
+        report["sizes"].append(benchmarkSize(size, options.max_fds, options.interval))
+    print("Benchmarking name resolution...")
+    report["names"] = benchmarkNames(options.lookups)
+
+    with open(options.output, "w") as output:
+        json.dump(report, output, indent=2)
+    for result in report["sizes"]:
+        print(f"{result['connections']:>8} connections: "
+              f"{result['stream_parse']['rows_per_second']:,.0f} rows/s streamed, "
+              f"{result['stream_parse']['peak_bytes'] / 1024:,.0f} KB peak streamed, "
+              f"{result['resolved_stream_parse']['peak_bytes'] / 1024:,.0f} KB peak streamed with pids, "
+              f"{result['list_parse']['peak_bytes'] / 1024:,.0f} KB peak listed, "
+              f"getAllBandwidth {result['get_all_bandwidth']['seconds']:.3f}s "
+              f"for {result['get_all_bandwidth']['pids']} pids")
+    print(f"Results written to {options.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,9 @@ if len(sys.argv) <= 1:
     #print(nw_helper.getAllBandwidth(interval=1,print_output=False))
     # print(nw_helper.getProcesses(args=["-n","-pid"]))
     #
+elif sys.argv[1] == "-exporter":
+    import Exporter
+    Exporter.main(sys.argv[2:])
 else:  # just add args later
     for arg in sys.argv[1:]:
         print(arg)
@@ -0,0 +1,106 @@
+"""
+
+
+These tests check the on-disk layout of Recording.py and round trip samples through SampleRecorder and SampleReader,
+across segment rollovers.
+
+usage: python -m pytest test_recording.py
+
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from Recording import SampleReader, SampleRecorder, segmentName
+from Results import BandwidthResult
+
+
+def makeSamples(count):
+    """
+
+    This function builds (timestamp, pid, bytes_sent, bytes_received, elapsed_time, interface) samples, one per second,
+    with an interface sample every fourth one.
+
+    """
+    samples = []
+    for i in range(count):
+        if i % 4 == 3:
+            samples.append((1000.0 + i, 0, i * 7, i * 11, 1.0, "eth0"))
+        else:
+            samples.append((1000.0 + i, 100 + i % 3, i * 1000, i * 2000, 1.0, ""))
+    return samples
+
+
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.samples = makeSamples(10)
+        with SampleRecorder(self.directory, records_per_segment=3) as recorder:
+            for timestamp, pid, sent, received, elapsed_time, interface in self.samples:
+                recorder.append(pid, sent, received, elapsed_time, timestamp, interface)
+        self.reader = SampleReader(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_segment_layout(self):
+        with open(os.path.join(self.directory, segmentName(1)), "rb") as segment:
+            data = segment.read()
+        # A 16 byte header, then 48 byte records.
+        self.assertEqual(len(data), 16 + 3 * 48)
+        self.assertEqual(data[:16], b"NHSAMPLE" + struct.pack("<II", 1, 48))
+        record = data[16 + 48:16 + 2 * 48]
+        self.assertEqual(struct.unpack_from("<d", record, 0)[0], 1001.0)
+        self.assertEqual(struct.unpack_from("<f", record, 8)[0], 1.0)
+        self.assertEqual(struct.unpack_from("<I", record, 12)[0], 101)
+        self.assertEqual(struct.unpack_from("<QQ", record, 16), (1000, 2000))
+        self.assertEqual(record[32:], bytes(16))
+
+    def test_index_covers_every_segment(self):
+        segments = self.reader.segments()
+        self.assertEqual([entry["records"] for entry in segments], [3, 3, 3, 1])
+        self.assertEqual([(entry["first"], entry["last"]) for entry in segments],
+                         [(1000.0, 1002.0), (1003.0, 1005.0), (1006.0, 1008.0), (1009.0, 1009.0)])
+
+    def test_round_trip(self):
+        self.assertEqual([tuple(record) for record in self.reader.query()], self.samples)
+
+    def test_range_queries_match_a_scan(self):
+        bounds = [None, 999.0, 1000.0, 1002.0, 1002.5, 1003.0, 1005.0, 1009.0, 1010.0]
+        for start in bounds:
+            for end in bounds:
+                expected = [sample for sample in self.samples
+                            if (start is None or sample[0] >= start) and (end is None or sample[0] <= end)]
+                self.assertEqual([tuple(record) for record in self.reader.query(start, end)], expected,
+                                 f"start={start} end={end}")
+
+    def test_filters_by_pid_and_interface(self):
+        self.assertEqual([record.timestamp for record in self.reader.query(pid=101)], [1001.0, 1004.0])
+        self.assertEqual([record.timestamp for record in self.reader.query(interface="eth0")], [1003.0, 1007.0])
+
+    def test_replay_returns_the_process_samples(self):
+        replayed = list(self.reader.replay(1003.0, 1005.0))
+        self.assertEqual([timestamp for timestamp, _ in replayed], [1004.0, 1005.0])
+        timestamp, result = replayed[0]
+        self.assertIsInstance(result, BandwidthResult)
+        self.assertEqual((result.pid, result.bytes_sent, result.bytes_received, result.elapsed_time),
+                         (101, 4000, 8000, 1.0))
+
+    def test_reads_the_segment_that_is_still_written(self):
+        recorder = SampleRecorder(self.directory, records_per_segment=3)
+        try:
+            recorder.append(200, 1, 2, 0.5, 2000.0)
+            recorder.flush()
+            records = list(SampleReader(self.directory).query(start=2000.0))
+            self.assertEqual([tuple(record) for record in records], [(2000.0, 200, 1, 2, 0.5, "")])
+        finally:
+            recorder.close()
+        self.assertEqual(len(list(self.reader.query())), len(self.samples) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+"""
+
+
+These tests check the netlink layouts SockDiag.py decodes. The buffers are built by hand from the C structs in
+linux/inet_diag.h and linux/tcp.h, not from the struct formats of the module, so a wrong format or offset shows up.
+
+usage: python -m pytest test_sockdiag.py
+
+"""
+
+import os
+import socket
+import struct
+import sys
+import time
+import unittest
+
+from SockDiag import NLMSG_DONE, SOCK_DIAG_BY_FAMILY, SockDiagCollector
+
+INODE = 424242
+BYTES_ACKED = 0x0102030405060708
+BYTES_RECEIVED = 987654321
+
+
+def inetDiagMsg(inode):
+    """
+
+    This function builds a struct inet_diag_msg: family, state, timer and retrans, the 48 byte inet_diag_sockid, and
+    expires, rqueue, wqueue, uid and inode.
+
+    """
+    sockid = struct.pack(">HH", 443, 51000) + bytes(16) + bytes(16) + struct.pack("=I", 0) + bytes(8)
+    message = bytes([socket.AF_INET, 1, 0, 0]) + sockid + struct.pack("=IIIII", 0, 0, 0, 1000, inode)
+    assert len(message) == 72
+    return message
+
+
+def rtattr(attrType, payload):
+    """
+
+    This function builds a netlink attribute, padded to 4 bytes.
+
+    """
+    length = 4 + len(payload)
+    return struct.pack("=HH", length, attrType) + payload + bytes(-length % 4)
+
+
+def tcpInfo(size=232):
+    """
+
+    This function builds a struct tcp_info with tcpi_bytes_acked at byte 120 and tcpi_bytes_received at byte 128.
+
+    """
+    info = bytearray(size)
+    if size >= 136:
+        info[120:128] = BYTES_ACKED.to_bytes(8, sys.byteorder)
+        info[128:136] = BYTES_RECEIVED.to_bytes(8, sys.byteorder)
+    return bytes(info)
+
+
+def nlmsg(msgType, payload, sequence=1):
+    """
+
+    This function wraps a payload in a struct nlmsghdr, padded to 4 bytes.
+
+    """
+    length = 16 + len(payload)
+    return struct.pack("=IHHII", length, msgType, 2, sequence, 0) + payload + bytes(-length % 4)
+
+
+class FakeNetlinkSocket:
+    """
+
+    The FakeNetlinkSocket class answers a dump request with prepared buffers, one per recv.
+
+    """
+
+    def __init__(self, buffers):
+        self.buffers = list(buffers)
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+        return len(data)
+
+    def recv(self, size):
+        return self.buffers.pop(0)
+
+
+class ParseMessageTest(unittest.TestCase):
+
+    def parse(self, *attributes):
+        data = inetDiagMsg(INODE) + b"".join(attributes)
+        return SockDiagCollector.parseMessage(data, 0, len(data))
+
+    def test_reads_the_byte_counters_of_tcp_info(self):
+        self.assertEqual(self.parse(rtattr(2, tcpInfo())), {INODE: (BYTES_ACKED, BYTES_RECEIVED)})
+
+    def test_skips_the_attributes_before_tcp_info(self):
+        # INET_DIAG_MEMINFO, and an attribute whose length is not a multiple of 4.
+        attributes = (rtattr(1, bytes(16)), rtattr(5, b"\x01"), rtattr(2, tcpInfo()))
+        self.assertEqual(self.parse(*attributes), {INODE: (BYTES_ACKED, BYTES_RECEIVED)})
+
+    def test_ignores_a_tcp_info_without_byte_counters(self):
+        # Kernels before 4.1 send a shorter tcp_info.
+        self.assertEqual(self.parse(rtattr(2, tcpInfo(104))), {})
+
+    def test_ignores_a_message_without_tcp_info(self):
+        self.assertEqual(self.parse(rtattr(1, bytes(16))), {})
+
+    def test_reads_the_inode_at_the_end_of_inet_diag_msg(self):
+        self.assertEqual(list(self.parse(rtattr(2, tcpInfo()))), [INODE])
+
+
+class DumpFamilyTest(unittest.TestCase):
+
+    def test_reads_every_message_until_done(self):
+        first = nlmsg(SOCK_DIAG_BY_FAMILY, inetDiagMsg(1) + rtattr(2, tcpInfo()))
+        second = nlmsg(SOCK_DIAG_BY_FAMILY, inetDiagMsg(2) + rtattr(2, tcpInfo()))
+        sock = FakeNetlinkSocket([first + second, nlmsg(NLMSG_DONE, struct.pack("=i", 0))])
+        sockets = SockDiagCollector().dumpFamily(sock, socket.AF_INET)
+        self.assertEqual(sockets, {1: (BYTES_ACKED, BYTES_RECEIVED), 2: (BYTES_ACKED, BYTES_RECEIVED)})
+        # struct nlmsghdr followed by the 56 byte struct inet_diag_req_v2.
+        self.assertEqual(len(sock.sent[0]), 16 + 56)
+
+    def test_raises_the_errno_of_an_error_message(self):
+        sock = FakeNetlinkSocket([nlmsg(2, struct.pack("=i", -13) + bytes(16))])
+        with self.assertRaises(OSError) as error:
+            SockDiagCollector().dumpFamily(sock, socket.AF_INET)
+        self.assertEqual(error.exception.errno, 13)
+
+
+class CountersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pid = os.getpid()
+        self.collector = SockDiagCollector()
+        self.collector.reader.buildInodeIndex = lambda pids: {INODE: self.pid}
+        self.dumps = []
+        self.collector.dumpSockets = lambda: self.dumps.pop(0)
+
+    def read(self, *dumps):
+        self.dumps.extend({INODE: counters} for counters in dumps)
+        return [self.collector.counters([self.pid])[self.pid] for _ in dumps]
+
+    def test_sums_the_growth_of_a_socket(self):
+        self.assertEqual(self.read((100, 10), (300, 30)), [(100, 10), (300, 30)])
+
+    def test_an_out_of_order_dump_does_not_count_bytes_twice(self):
+        # A dump taken before the last one is applied after it.
+        self.assertEqual(self.read((100, 10), (300, 30), (200, 20), (300, 30)),
+                         [(100, 10), (300, 30), (300, 30), (300, 30)])
+
+    def test_keeps_the_bytes_of_a_closed_socket(self):
+        self.read((100, 10))
+        self.dumps.append({})
+        self.assertEqual(self.collector.counters([self.pid])[self.pid], (100, 10))
+
+
+@unittest.skipUnless(SockDiagCollector.isSupported(), "sock_diag is not available")
+class KernelTest(unittest.TestCase):
+
+    def test_counts_the_bytes_of_a_real_socket(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        client = socket.create_connection(server.getsockname())
+        accepted, _ = server.accept()
+        with server, client, accepted:
+            client.sendall(b"x" * 10000)
+            received = 0
+            while received < 10000:
+                received += len(accepted.recv(65536))
+            time.sleep(0.05)
+            sockets = SockDiagCollector().dumpSockets()
+            bytes_acked, bytes_received = sockets[os.fstat(client.fileno()).st_ino]
+            # The kernel counts the SYN as one acked byte.
+            self.assertIn(bytes_acked, (10000, 10001))
+            self.assertEqual(bytes_received, 0)
+            bytes_acked, bytes_received = sockets[os.fstat(accepted.fileno()).st_ino]
+            self.assertIn(bytes_acked, (0, 1))
+            self.assertEqual(bytes_received, 10000)
+
+
+if __name__ == "__main__":
+    unittest.main()